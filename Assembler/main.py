@@ -1,4 +1,16 @@
-symbol_table = {
+import argparse
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice, permutations
+
+PREDEFINED_SYMBOLS = {
     "SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
     "R0": 0, "R1": 1, "R2": 2, "R3": 3, "R4": 4, "R5": 5, 
     "R6": 6, "R7": 7, "R8": 8, "R9": 9, "R10": 10, "R11": 11,
@@ -27,43 +39,93 @@ def parse_a_instruction(instruction, symbol_table, next_available_address):
             
             return binary_value, symbol_table, next_available_address
 
+DEST_BITS = {
+    '': '000', 'M': '001', 'D': '010', 'MD': '011', 'A': '100', 'AM': '101', 'AD': '110', 'AMD': '111'
+}
+
+COMP_BITS = {
+    '0': '0101010', '1': '0111111', '-1': '0111010', 'D': '0001100', 'A': '0110000', '!D': '0001101',
+    '!A': '0110001', '-D': '0001111', '-A': '0110011', 'D+1': '0011111', 'A+1': '0110111', 'D-1': '0001110',
+    'A-1': '0110010', 'D+A': '0000010', 'D-A': '0010011', 'A-D': '0000111', 'D&A': '0000000', 'D|A': '0010101',
+    'M': '1110000', '!M': '1110001', '-M': '1110011', 'M+1': '1110111', 'M-1': '1110010', 'D+M': '1000010',
+    'D-M': '1010011', 'M-D': '1000111', 'D&M': '1000000', 'D|M': '1010101'
+}
+
+JUMP_BITS = {
+    '': '000', 'JGT': '001', 'JEQ': '010', 'JGE': '011', 'JLT': '100', 'JNE': '101', 'JLE': '110', 'JMP': '111'
+}
+
+# Operand orders the ALU treats the same, e.g. A+D is D+A
+COMP_ALIASES = {
+    'A+D': 'D+A', 'A&D': 'D&A', 'A|D': 'D|A', 'M+D': 'D+M', 'M&D': 'D&M', 'M|D': 'D|M',
+    '1+D': 'D+1', '1+A': 'A+1', '1+M': 'M+1'
+}
+
+def build_c_instruction_table():
+    # Every legal C-instruction text mapped to its binary code, so encoding a line is one dict lookup
+    comps = dict(COMP_BITS)
+    for alias, comp in COMP_ALIASES.items():
+        comps[alias] = COMP_BITS[comp]
+
+    dests = {}
+    for dest, bits in DEST_BITS.items():
+        for order in set(permutations(dest)):
+            dests[''.join(order)] = bits
+
+    table = {}
+    for comp, comp_bin in comps.items():
+        for dest, dest_bin in dests.items():
+            for jump, jump_bin in JUMP_BITS.items():
+                text = comp
+                if dest:
+                    text = dest + '=' + text
+                if jump:
+                    text = text + ';' + jump
+                table[text] = '111' + comp_bin + dest_bin + jump_bin
+
+    return table
+
+C_INSTRUCTIONS = build_c_instruction_table()
+C_INSTRUCTION_WORDS = {text: int(code, 2) for text, code in C_INSTRUCTIONS.items()}
+
 def parse_c_instruction(instruction):
-    instruction = instruction.split("//")[0].strip()
+    binary_instruction = C_INSTRUCTIONS.get(instruction)
+
+    if binary_instruction is None:
+        # Slow path for lines that still carry a comment or inner whitespace
+        instruction = ''.join(instruction.split("//")[0].split())
+        binary_instruction = C_INSTRUCTIONS.get(instruction)
+
+        if binary_instruction is None:
+            raise ValueError(f"Invalid C-instruction: {instruction}")
 
-    dest_dict = {
-        '': '000', 'M': '001', 'D': '010', 'MD': '011', 'A': '100', 'AM': '101', 'AD': '110', 'AMD': '111'
-    }
-
-    comp_dict = {
-        '0': '0101010', '1': '0111111', '-1': '0111010', 'D': '0001100', 'A': '0000001', 'M': '1110000',
-        'D+1': '0011111', 'A+1': '0000111', 'D-1': '0000011', 'A-1': '0000110', 'D+A': '0000010',
-        'D-A': '0010011', 'A-D': '0000111', 'D&A': '0000000', 'D|A': '0010101'
-    }
-
-    jump_dict = {
-        '': '000', 'JEQ': '001', 'JGT': '010', 'JLT': '011', 'JNE': '100', 'JGE': '101', 'JLE': '110', 'JMP': '111'
-    }
-
-    if '=' in instruction and ';' in instruction:
-        dest, comp_jump = instruction.split('=')
-        comp, jump = comp_jump.split(';')
-    elif '=' in instruction:
-        dest, comp = instruction.split('=')
-        jump = ''
-    elif ';' in instruction:
-        dest = ''
-        comp, jump = instruction.split(';')
-
-    dest_bin = dest_dict.get(dest, '000')
-    comp_bin = comp_dict.get(comp, '0000000')
-    jump_bin = jump_dict.get(jump, '000')
-
-    binary_instruction = '111' + comp_bin + dest_bin + jump_bin
-    
     return binary_instruction
 
-def assemble(instructions, symbol_table):
-    machine_code = []
+def build_label_index(instructions):
+    # First pass: map every (LABEL) to the ROM address of the instruction that follows it
+    labels = {}
+    rom_address = 0
+
+    for instruction in instructions:
+        instruction = instruction.strip()
+
+        if not instruction:
+            continue
+
+        if instruction.startswith("("):
+            label = instruction[1:instruction.index(")")].strip()
+
+            if label in labels:
+                raise ValueError(f"Duplicate label: {label}")
+
+            labels[label] = rom_address
+        else:
+            rom_address += 1
+
+    return labels
+
+def encode_instructions(instructions, symbol_table):
+    # Second pass as a generator, so lines can be encoded as they stream in
     next_available_address = 16  # Start the address for new variables from 16
 
     for instruction in instructions:
@@ -71,38 +133,345 @@ def assemble(instructions, symbol_table):
 
         if instruction.startswith("@"):  # A-instruction
             binary_instruction, symbol_table, next_available_address = parse_a_instruction(instruction, symbol_table, next_available_address)
-            machine_code.append(binary_instruction)
-        
-        elif '=' in instruction or ';' in instruction:  # C-instruction
-            binary_instruction = parse_c_instruction(instruction)
-            machine_code.append(binary_instruction)
+            yield binary_instruction
 
-    return machine_code
+        elif instruction.startswith("("):  # Label, already resolved in the first pass
+            continue
 
-def read_asm_file(file_path):
+        elif instruction:  # C-instruction
+            yield parse_c_instruction(instruction)
+
+def assemble(instructions, symbol_table):
+    symbol_table.update(build_label_index(instructions))
+
+    # Second pass: encode against the complete symbol table
+    return list(encode_instructions(instructions, symbol_table))
+
+def clean_lines(lines):
+    for line in lines:
+        line = line.split("//")[0].strip()
+
+        if line:
+            yield line
+
+def iter_asm_file(file_path):
     with open(file_path, 'r') as file:
-        instructions = []
+        yield from clean_lines(file)
+
+def read_asm_file(file_path):
+    return list(iter_asm_file(file_path))
+
+WRITE_BATCH_SIZE = 4096  # Instructions joined into each write call
+
+@contextmanager
+def replace_file(output_path, mode='w'):
+    # Write a temporary file and rename it over the output, so an output hard-linked
+    # into the cache is replaced rather than overwritten through the link
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+
+    try:
+        with open(temp_path, mode) as file:
+            yield file
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+def write_hack_file(output_path, machine_code, batch_size=WRITE_BATCH_SIZE):
+    machine_code = iter(machine_code)
+
+    with replace_file(output_path) as file:
+        while True:
+            batch = list(islice(machine_code, batch_size))
+
+            if not batch:
+                break
+
+            file.write('\n'.join(batch) + '\n')
+
+def assemble_file_streaming(asm_path, output_path, symbol_table, packed=False):
+    # Only the label index is kept in memory; the source is read twice instead of being held as a list
+    symbol_table.update(build_label_index(iter_asm_file(asm_path)))
+
+    machine_code = encode_instructions(iter_asm_file(asm_path), symbol_table)
+
+    if packed:
+        write_rom_file(output_path, machine_code)
+    else:
+        write_hack_file(output_path, machine_code)
+
+# Packed ROM image: a small header followed by little-endian uint16 words
+ROM_MAGIC = b'HACK'
+ROM_VERSION = 1
+ROM_HEADER = struct.Struct('<4sHHI')  # magic, version, reserved, word count
+
+def write_rom_file(output_path, machine_code):
+    write_rom_words(output_path, (int(code, 2) for code in machine_code))
+
+def write_rom_words(output_path, words):
+    words = array('H', words)
+
+    if sys.byteorder == 'big':
+        words.byteswap()
+
+    with replace_file(output_path, 'wb') as file:
+        file.write(ROM_HEADER.pack(ROM_MAGIC, ROM_VERSION, 0, len(words)))
+        words.tofile(file)
+
+def load_rom_file(file_path, use_numpy=False):
+    # Memory-map the image and return a zero-copy view of its words
+    with open(file_path, 'rb') as file:
+        rom = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, _, count = ROM_HEADER.unpack_from(rom)
+
+    if magic != ROM_MAGIC or version != ROM_VERSION:
+        raise ValueError(f"Not a packed Hack ROM: {file_path}")
+
+    if ROM_HEADER.size + count * 2 > len(rom):
+        raise ValueError(f"Truncated Hack ROM: {file_path}")
 
+    if use_numpy:
+        import numpy
+        return numpy.frombuffer(rom, dtype='<u2', count=count, offset=ROM_HEADER.size)
+
+    if sys.byteorder == 'big':
+        words = array('H', rom[ROM_HEADER.size:ROM_HEADER.size + count * 2])
+        words.byteswap()
+        return words
+
+    return memoryview(rom)[ROM_HEADER.size:ROM_HEADER.size + count * 2].cast('H')
+
+# Source map: one "address<TAB>line<TAB>label<TAB>command" line per ROM word
+# First words of the VM commands the VM translator writes as comments above their code
+VM_COMMANDS = {
+    "push", "pop", "add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not",
+    "label", "goto", "if-goto", "function", "call", "return"
+}
+
+def build_source_map(lines):
+    # Yields (line number, last label, VM command, source file) for each instruction. The
+    # command is the last full-line comment that reads as a VM command, so other comments,
+    # as in hand-written assembly, leave it empty
+    label = ""
+    command = ""
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+
+        if line.startswith("//"):
+            text = line[2:].strip()
+            command = text if text.split(" ", 1)[0] in VM_COMMANDS else ""
+            continue
+
+        line = line.split("//")[0].strip()
+
+        if line.startswith("("):
+            label = line[1:line.index(")")].strip()
+        elif line:
+            yield line_number, label, command, ""
+
+def source_map_path(output_path):
+    return os.path.splitext(output_path)[0] + '.map'
+
+def write_source_map(map_path, entries):
+    with open(map_path, 'w') as file:
+        for address, (line_number, label, command, source) in enumerate(entries):
+            file.write(f"{address}\t{line_number}\t{label}\t{command.replace(chr(9), ' ')}\t{source}\n")
+
+def load_source_map(map_path):
+    """Returns a (line number, label, command, source file) tuple for each ROM address."""
+    entries = []
+
+    with open(map_path, 'r') as file:
         for line in file:
-            line = line.split("//")[0].strip()
-            
-            if line: 
-                instructions.append(line)
-        
-        return instructions
+            address, line_number, label, command, source = line.rstrip('\n').split('\t')
+
+            if int(address) != len(entries):
+                raise ValueError(f"Source map out of order at address {address}: {map_path}")
+
+            entries.append((int(line_number), label, command, source))
+
+    return entries
+
+def write_asm_source_map(asm_path, output_path):
+    with open(asm_path, 'r') as file:
+        write_source_map(source_map_path(output_path), build_source_map(file))
+
+# Bump whenever encoding changes so stale cache entries are never reused
+ASSEMBLER_VERSION = '1.1'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hack-assembler')
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+class AssemblyCache:
+    """On-disk cache of assembled outputs keyed by a hash of the source and assembler version."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, asm_path, packed=False):
+        digest = hashlib.sha256(f"{ASSEMBLER_VERSION}:{int(packed)}:".encode())
+
+        with open(asm_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def entry_path(self, key, packed=False):
+        return os.path.join(self.cache_dir, key + ('.rom' if packed else '.hack'))
+
+    def fetch(self, key, output_path, packed=False):
+        entry = self.entry_path(key, packed)
+
+        if not os.path.exists(entry):
+            self.misses += 1
+            return False
+
+        if not (os.path.exists(output_path) and os.path.samefile(entry, output_path)):
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            link_or_copy(entry, output_path)
+
+        os.utime(entry)  # Mark as recently used for eviction
+        self.hits += 1
+        self.bytes_saved += os.path.getsize(entry)
+        return True
+
+    def store(self, key, output_path, packed=False):
+        entry = self.entry_path(key, packed)
+        temp_path = f"{entry}.{os.getpid()}.tmp"
+
+        link_or_copy(output_path, temp_path)
+        os.replace(temp_path, entry)
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_size
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+
+            os.unlink(path)
+            total_size -= size
+
+    def stats(self):
+        return self.hits, self.misses, self.bytes_saved
+
+def link_or_copy(source_path, target_path):
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+class Assembler:
+    """Assembles Hack programs, giving each run its own symbol table."""
+
+    def __init__(self, cache=None):
+        self.symbol_table = dict(PREDEFINED_SYMBOLS)
+        self.cache = cache
+
+    def reset(self):
+        self.symbol_table = dict(PREDEFINED_SYMBOLS)
+
+    def assemble_lines(self, instructions):
+        self.reset()
+        instructions = list(clean_lines(instructions))
+        return assemble(instructions, self.symbol_table)
+
+    def assemble_string(self, source):
+        return self.assemble_lines(source.splitlines())
+
+    def assemble_file(self, asm_path, output_path=None, packed=False):
+        if output_path is None:
+            output_path = default_output_path(asm_path, packed)
+
+        if self.cache:
+            key = self.cache.key(asm_path, packed)
+
+            if self.cache.fetch(key, output_path, packed):
+                return output_path
+
+        self.reset()
+        assemble_file_streaming(asm_path, output_path, self.symbol_table, packed)
+
+        if self.cache:
+            self.cache.store(key, output_path, packed)
+
+        return output_path
+
+def default_output_path(asm_path, packed=False):
+    return os.path.splitext(asm_path)[0] + ('.rom' if packed else '.hack')
+
+def assemble_file(asm_path, packed=False, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, source_map=False):
+    # Module-level so it can be pickled into a worker process
+    cache = AssemblyCache(cache_dir, cache_size) if cache_dir else None
+    output_path = Assembler(cache).assemble_file(asm_path, packed=packed)
+
+    if source_map:
+        write_asm_source_map(asm_path, output_path)
+
+    return output_path, cache.stats() if cache else (0, 0, 0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assemble Hack .asm files into machine code.")
+    parser.add_argument('files', nargs='+', help=".asm files to assemble")
+    parser.add_argument('-o', '--output', help="output path (only with a single input file)")
+    parser.add_argument('--packed', action='store_true', help="write packed binary .rom images instead of .hack text")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes for multiple files")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="directory for cached outputs")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024), help="cache size limit in MB")
+    parser.add_argument('--no-cache', action='store_true', help="always assemble, bypassing the cache")
+    parser.add_argument('--source-map', action='store_true', help="also write a .map file from ROM addresses to source lines")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.files) > 1:
+        parser.error("--output can only be used with a single input file")
 
-def write_hack_file(output_path, machine_code):
-    with open(output_path, 'w') as file:
-        for code in machine_code:
-            file.write(code + '\n')
+    cache_dir = None if args.no_cache else args.cache_dir
+    cache_size = args.cache_size * 1024 * 1024
 
-assembly_file_path = 'Pong.asm'  
-hack_file_path = 'Pong.hack'
+    if args.output:
+        cache = AssemblyCache(cache_dir, cache_size) if cache_dir else None
+        output_path = Assembler(cache).assemble_file(args.files[0], args.output, args.packed)
+        if args.source_map:
+            write_asm_source_map(args.files[0], output_path)
+        results = [(output_path, cache.stats() if cache else (0, 0, 0))]
+    elif len(args.files) == 1 or args.jobs <= 1:
+        results = [assemble_file(path, args.packed, cache_dir, cache_size, args.source_map) for path in args.files]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            count = len(args.files)
+            results = list(executor.map(assemble_file, args.files, [args.packed] * count,
+                                        [cache_dir] * count, [cache_size] * count, [args.source_map] * count))
 
-instructions = read_asm_file(assembly_file_path)
+    hits = misses = bytes_saved = 0
 
-machine_code = assemble(instructions, symbol_table)
+    for output_path, (file_hits, file_misses, file_bytes_saved) in results:
+        print(f"Machine code written to {output_path}")
+        hits += file_hits
+        misses += file_misses
+        bytes_saved += file_bytes_saved
 
-write_hack_file(hack_file_path, machine_code)
+    if cache_dir:
+        AssemblyCache(cache_dir, cache_size).evict()
+        print(f"Cache: {hits} hits, {misses} misses, {bytes_saved} bytes saved")
 
-print(f"Machine code written to {hack_file_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,742 @@
+import argparse
+import importlib.util
+import math
+import os
+import re
+import sys
+import time
+from array import array
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+ASSEMBLER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Assembler", "main.py")
+
+# ALU outputs for the six control bits zx nx zy ny f no, with x = D and y = A or M.
+# These are the combinations the assembler can emit; any other is computed bit by bit.
+ALU_EXPRESSIONS = {
+    '101010': "0",
+    '111111': "1",
+    '111010': "0xFFFF",
+    '001100': "x",
+    '110000': "y",
+    '001101': "x ^ 0xFFFF",
+    '110001': "y ^ 0xFFFF",
+    '001111': "-x & 0xFFFF",
+    '110011': "-y & 0xFFFF",
+    '011111': "(x + 1) & 0xFFFF",
+    '110111': "(y + 1) & 0xFFFF",
+    '001110': "(x - 1) & 0xFFFF",
+    '110010': "(y - 1) & 0xFFFF",
+    '000010': "(x + y) & 0xFFFF",
+    '010011': "(x - y) & 0xFFFF",
+    '000111': "(y - x) & 0xFFFF",
+    '000000': "x & y",
+    '010101': "x | y"
+}
+
+
+def alu_expression(control):
+    """Returns a Python expression over x and y for six ALU control bits."""
+    if control in ALU_EXPRESSIONS:
+        return ALU_EXPRESSIONS[control]
+
+    zx, nx, zy, ny, f, no = (bit == '1' for bit in control)
+    x = "0" if zx else "x"
+    x = f"({x} ^ 0xFFFF)" if nx else x
+    y = "0" if zy else "y"
+    y = f"({y} ^ 0xFFFF)" if ny else y
+    out = f"(({x} + {y}) & 0xFFFF)" if f else f"({x} & {y})"
+    return f"({out} ^ 0xFFFF)" if no else out
+
+
+def build_alu_table():
+    # One compiled function per control pattern, so executing a comp field is a single call
+    return [eval(f"lambda x, y: {alu_expression(format(control, '06b'))}") for control in range(64)]
+
+
+ALU_FUNCTIONS = build_alu_table()
+
+# Jump bits j1 j2 j3 test out < 0, out = 0 and out > 0
+JUMP_LT, JUMP_EQ, JUMP_GT = 4, 2, 1
+# Dest bits d1 d2 d3 store to A, D and M
+DEST_A, DEST_D, DEST_M = 4, 2, 1
+
+# Jump conditions on the 16-bit ALU output, as Python source for compiled blocks
+JUMP_CONDITIONS = {
+    1: "0 < out < 0x8000",
+    2: "out == 0",
+    3: "out < 0x8000",
+    4: "out >= 0x8000",
+    5: "out != 0",
+    6: "not 0 < out < 0x8000",
+    7: "True"
+}
+
+
+def load_assembler():
+    """Imports Assembler/main.py, which lives outside this directory, once per process."""
+    if "hack_assembler" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("hack_assembler", ASSEMBLER_PATH)
+        assembler = importlib.util.module_from_spec(spec)
+        sys.modules["hack_assembler"] = assembler
+        spec.loader.exec_module(assembler)
+    return sys.modules["hack_assembler"]
+
+
+def load_program(file_path):
+    """Reads a .hack text file or a packed .rom image into a list of 16-bit words."""
+    if file_path.endswith(".rom"):
+        return list(load_assembler().load_rom_file(file_path))
+
+    with open(file_path, 'r') as file:
+        return [int(line, 2) for line in map(str.strip, file) if line]
+
+
+def decode(word):
+    """Pre-decodes one instruction: an int for an A-instruction, else (alu, reads_m, dest, jump)."""
+    if not word & 0x8000:
+        return word
+
+    reads_m = bool(word & 0x1000)
+    return ALU_FUNCTIONS[(word >> 6) & 0x3F], reads_m, (word >> 3) & 7, word & 7
+
+
+def is_halt_loop(program, pc):
+    # "@n" at n - 1 followed by "0;JMP" at n: the end-of-program idiom
+    word = program[pc]
+    return word == 0xEA87 and pc > 0 and program[pc - 1] == pc - 1
+
+
+MAX_BLOCK_LENGTH = 256  # Instructions compiled into one block at most
+
+
+def compile_block(program, start, halts):
+    """Compiles the code entered at start into one function.
+
+    A block runs straight through not-taken conditional jumps, which become side exits, and
+    follows jumps to constant targets, so a loop body or call sequence becomes one call. It
+    ends at a computed jump, a jump back into itself, a halt, or MAX_BLOCK_LENGTH instructions.
+    The function takes (a, d, ram) and returns (a, d, next_pc, instructions_executed). While A
+    holds a constant from an A-instruction, RAM addresses and jump targets are inlined.
+    """
+    lines = ["def block(a, d, ram):"]
+    known_a = None  # Value of A while it is a compile-time constant
+    visited = set()
+    pc = start
+    count = 0
+
+    while True:
+        a = "a" if known_a is None else known_a
+
+        if pc >= len(program) or halts[pc] or pc in visited or count == MAX_BLOCK_LENGTH:
+            lines.append(f"    return {a}, d, {pc}, {count}")
+            break
+
+        visited.add(pc)
+        word = program[pc]
+        pc += 1
+        count += 1
+
+        if not word & 0x8000:
+            known_a = word  # Only stored into a when the block exits
+            continue
+
+        address = str(a)
+        y = f"ram[{address}]" if word & 0x1000 else address
+        out = alu_expression(format((word >> 6) & 0x3F, '06b'))
+        out = re.sub(r"\by\b", y, re.sub(r"\bx\b", "d", out))
+        dest, jump = (word >> 3) & 7, word & 7
+        # One chained assignment stores M, D and A in the order the hardware sees them
+        stores = [name for bit, name in ((DEST_M, f"ram[{address}]"), (DEST_D, "d"), (DEST_A, "a")) if dest & bit]
+        result = "d" if dest & DEST_D else "out"
+        if jump not in (0, 7) and result == "out":
+            stores.append("out")  # The jump condition needs the ALU output
+
+        target = address
+        if jump and known_a is None and dest & DEST_A:
+            lines.append("    target = a")
+            target = "target"
+
+        if stores:
+            lines.append(f"    {' = '.join(stores)} = {out}")
+
+        if dest & DEST_A:
+            known_a = None
+
+        if not jump:
+            continue
+
+        a = "a" if known_a is None else known_a
+
+        if jump != 7:
+            lines.append(f"    if {JUMP_CONDITIONS[jump].replace('out', result)}:")
+            lines.append(f"        return {a}, d, {target}, {count}")
+        elif not target.isdigit():
+            lines.append(f"    return {a}, d, {target}, {count}")
+            break
+        else:
+            pc = int(target)  # Follow a constant jump into the same block
+
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["block"], count
+
+
+class Emulator:
+    """Runs Hack machine code with RAM in an array('H') and every ROM word decoded up front."""
+
+    def __init__(self, program, compiled=False):
+        self.program = array('H', program)
+        self.code = [decode(word) for word in self.program]
+        self.halts = [is_halt_loop(self.program, pc) for pc in range(len(self.program))]
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.compiled = compiled
+        self.blocks = {}  # Entry address to (function, length), compiled on first entry
+        self.reset()
+
+    @classmethod
+    def from_file(cls, file_path, compiled=False):
+        return cls(load_program(file_path), compiled)
+
+    def reset(self):
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def halted(self):
+        return self.pc >= len(self.code) or self.halts[self.pc]
+
+    def set_key(self, key_code):
+        self.ram[KBD] = key_code
+
+    def step(self):
+        """Executes one instruction."""
+        return self.interpret(1)
+
+    def run(self, max_cycles=None):
+        """Executes until the program halts or max_cycles instructions ran; returns the count."""
+        if self.compiled:
+            return self.run_blocks(max_cycles)
+        return self.interpret(max_cycles)
+
+    def run_blocks(self, max_cycles=None):
+        # Chains compiled basic blocks; a block longer than the remaining budget is interpreted
+        blocks, halts, ram = self.blocks, self.halts, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        size = len(self.code)
+        remaining = math.inf if max_cycles is None else max_cycles
+        executed = 0
+
+        try:
+            while remaining and pc < size and not halts[pc]:
+                block = blocks.get(pc)
+
+                if block is None:
+                    block = blocks[pc] = compile_block(self.program, pc, halts)
+
+                function, length = block
+                if length > remaining:
+                    break
+
+                a, d, pc, count = function(a, d, ram)
+                remaining -= count
+                executed += count
+        except IndexError:
+            raise ValueError(f"Memory access out of range in the block at PC={pc}") from None
+        finally:
+            self.a, self.d, self.pc = a, d, pc
+
+        self.cycles += executed
+
+        if remaining and remaining != math.inf and not self.halted():
+            executed += self.interpret(remaining)
+
+        return executed
+
+    def interpret(self, max_cycles=None):
+        code, halts, ram = self.code, self.halts, self.ram
+        a, d, pc = self.a, self.d, self.pc
+        size = len(code)
+        remaining = -1 if max_cycles is None else max_cycles
+
+        try:
+            while remaining and pc < size and not halts[pc]:
+                remaining -= 1
+                instruction = code[pc]
+
+                if instruction.__class__ is int:
+                    a = instruction
+                    pc += 1
+                    continue
+
+                alu, reads_m, dest, jump = instruction
+                out = alu(d, ram[a] if reads_m else a)
+                target = a
+
+                if dest:
+                    if dest & DEST_M:
+                        ram[a] = out
+                    if dest & DEST_D:
+                        d = out
+                    if dest & DEST_A:
+                        a = out
+
+                if jump and jump & (JUMP_LT if out & 0x8000 else JUMP_GT if out else JUMP_EQ):
+                    pc = target
+                else:
+                    pc += 1
+        except IndexError:
+            raise ValueError(f"Memory access out of range at PC={pc}, A={a}") from None
+        finally:
+            self.a, self.d, self.pc = a, d, pc
+
+        executed = (max_cycles if max_cycles is not None else -1) - remaining
+        self.cycles += executed
+        return executed
+
+
+def function_name(label):
+    """The VM function a label belongs to: "Main.fib" for "Main.fib$ret.2", else the label itself."""
+    function = label.split('$')[0]
+    return function if '.' in function else label
+
+
+class Profiler:
+    """Runs an emulator while counting executions per ROM address, taken jumps and cycles per call stack.
+
+    source_map holds a (line, label, command, source) entry per ROM address, as loaded from the .map
+    file the assembler or VM translator writes. Calls are recognised by the VM calling
+    convention: control reaching the first address of a VM function with LCL equal to SP
+    pushes a frame whose return address is the one saved 5 words below SP, and reaching
+    that address with SP below the frame pops it. Emulator.run itself is untouched, so
+    there is no cost when profiling is off.
+    """
+
+    def __init__(self, emulator, source_map=None, root="program"):
+        size = len(emulator.code)
+        self.emulator = emulator
+        self.source_map = source_map or [(0, "", "", "")] * size
+        if len(self.source_map) != size:
+            raise ValueError(f"Source map has {len(self.source_map)} entries for {size} ROM words")
+
+        self.root = root
+        self.counts = array('Q', bytes(8 * size))
+        self.taken = array('Q', bytes(8 * size))
+        self.functions = [function_name(entry[1]) for entry in self.source_map]
+        # Addresses where a VM function may start; checked against the stack frame at run time
+        self.entries = bytearray(size)
+        for address, function in enumerate(self.functions):
+            if '.' in function and '$' not in function and (address == 0 or self.functions[address - 1] != function):
+                self.entries[address] = 1
+
+        self.frames = []  # (function, return address, SP) for each active call
+        self.stacks = {}  # Call stack to instructions executed in it
+        self.mark = emulator.cycles  # Cycle count when the current stack was entered
+
+    def return_address(self):
+        return self.frames[-1][1] if self.frames else -1
+
+    def charge(self, now):
+        stack = tuple(frame[0] for frame in self.frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + now - self.mark
+        self.mark = now
+
+    def transfer(self, pc, now):
+        # Control reached a function entry or the current return address. The two can share
+        # an address (the bootstrap's return label precedes the first function), so the stack
+        # decides: a call has just set LCL to SP, a return has dropped SP below the frame.
+        ram = self.emulator.ram
+        frames = self.frames
+        sp = ram[0]
+
+        if self.entries[pc] and ram[1] == sp and 5 <= sp and not (frames and frames[-1][2] == sp):
+            # A jump back to a loop at the entry keeps the same frame
+            self.charge(now)
+            frames.append((self.functions[pc], ram[sp - 5], sp))
+        elif frames and pc == frames[-1][1] and sp < frames[-1][2]:
+            self.charge(now)
+            frames.pop()
+
+        return self.return_address()
+
+    def run(self, max_cycles=None):
+        """Executes like Emulator.interpret while profiling; returns the instruction count."""
+        emulator = self.emulator
+        code, halts, ram = emulator.code, emulator.halts, emulator.ram
+        counts, taken, entries = self.counts, self.taken, self.entries
+        a, d, pc = emulator.a, emulator.d, emulator.pc
+        size = len(code)
+        start = -1 if max_cycles is None else max_cycles
+        remaining = start
+        return_to = self.return_address()
+        base = emulator.cycles
+
+        try:
+            while remaining and pc < size and not halts[pc]:
+                if pc == return_to or entries[pc]:
+                    return_to = self.transfer(pc, base + start - remaining)
+
+                remaining -= 1
+                counts[pc] += 1
+                instruction = code[pc]
+
+                if instruction.__class__ is int:
+                    a = instruction
+                    pc += 1
+                    continue
+
+                alu, reads_m, dest, jump = instruction
+                out = alu(d, ram[a] if reads_m else a)
+                target = a
+
+                if dest:
+                    if dest & DEST_M:
+                        ram[a] = out
+                    if dest & DEST_D:
+                        d = out
+                    if dest & DEST_A:
+                        a = out
+
+                if jump and jump & (JUMP_LT if out & 0x8000 else JUMP_GT if out else JUMP_EQ):
+                    taken[pc] += 1
+                    pc = target
+                else:
+                    pc += 1
+        except IndexError:
+            raise ValueError(f"Memory access out of range at PC={pc}, A={a}") from None
+        finally:
+            emulator.a, emulator.d, emulator.pc = a, d, pc
+            emulator.cycles = base + start - remaining
+            self.charge(emulator.cycles)
+
+        return start - remaining
+
+    def location(self, address):
+        line, label, command, source = self.source_map[address]
+        return f"line {line}" if line else "", label, command, source
+
+    def hot_spots(self, key="address"):
+        """Returns (name, instructions) pairs, busiest first, for each address, line, label, command, source or function.
+
+        Functions are charged with their self time from the call stacks, so code outside any
+        call counts towards the root.
+        """
+        totals = {}
+
+        if key == "function":
+            for stack, count in self.stacks.items():
+                name = stack[-1] if stack else self.root
+                totals[name] = totals.get(name, 0) + count
+
+            return sorted(totals.items(), key=lambda item: -item[1])
+
+        for address, count in enumerate(self.counts):
+            if not count:
+                continue
+
+            if key == "address":
+                name = address
+            else:
+                name = self.source_map[address][("line", "label", "command", "source").index(key)]
+
+            totals[name] = totals.get(name, 0) + count
+
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def branches(self):
+        """Returns (address, executed, taken) for each conditional jump that ran, most executed first."""
+        sites = []
+
+        for address, count in enumerate(self.counts):
+            instruction = self.emulator.code[address]
+            if count and instruction.__class__ is not int and instruction[3] not in (0, 7):
+                sites.append((address, count, self.taken[address]))
+
+        return sorted(sites, key=lambda site: -site[1])
+
+    def report(self, limit=20):
+        """Formats the hot spots by function, label, VM command and address, and the busiest branches."""
+        total = sum(self.counts) or 1
+        lines = []
+
+        for key in ("function", "label", "command"):
+            spots = [(name, count) for name, count in self.hot_spots(key) if name != ""]
+            if not spots:
+                continue
+
+            lines.append(f"Hot spots by {key}")
+            for name, count in spots[:limit]:
+                lines.append(f"{count:>14} {100 * count / total:6.2f}%  {name}")
+            lines.append("")
+
+        lines.append("Hot spots by address")
+        for address, count in self.hot_spots("address")[:limit]:
+            details = "  ".join(part for part in self.location(address) if part)
+            lines.append(f"{count:>14} {100 * count / total:6.2f}%  {address:>5}  {details}")
+
+        branches = self.branches()
+        if branches:
+            lines.append("")
+            lines.append("Branches")
+            for address, count, taken in branches[:limit]:
+                details = "  ".join(part for part in self.location(address) if part)
+                lines.append(f"{count:>14} {100 * taken / count:6.2f}% taken  {address:>5}  {details}")
+
+        return "\n".join(lines)
+
+    def folded_stacks(self):
+        """Yields "root;caller;callee count" lines, the input format of flamegraph.pl and speedscope."""
+        for stack, count in sorted(self.stacks.items()):
+            if count:
+                yield f"{';'.join((self.root,) + stack)} {count}"
+
+
+# Rows of the BatchEmulator state: the registers, then RAM
+REG_A, REG_D, REG_PC = 0, 1, 2
+RAM_BASE = 3
+PARKED = 0x10000  # Scheduling PC of a machine that stopped, above any real PC
+
+
+class BatchEmulator:
+    """Runs one program on many machines at once, each machine a uint16 column of one NumPy array.
+
+    Every step executes one instruction for all the machines at the lowest live PC, so
+    machines that split at a conditional jump run apart under a mask and merge again when
+    their PCs meet. Keeping a machine in a column puts the same register or RAM word of
+    all machines side by side, which is what each step reads and writes. ram_size can be
+    cut down for programs that use little memory.
+
+    A machine that addresses RAM past ram_size is marked in faulted and stops with its PC
+    on the faulting instruction, while the others keep running.
+    """
+
+    def __init__(self, program, count, ram_size=RAM_SIZE):
+        import numpy
+
+        self.program = array('H', program)
+        self.code = [decode(word) for word in self.program]
+        # Indexed by any 16-bit PC: True where a machine stops
+        self.stops = numpy.ones(0x10000, dtype=bool)
+        self.stops[:len(self.program)] = [is_halt_loop(self.program, pc) for pc in range(len(self.program))]
+        self.state = numpy.zeros((RAM_BASE + ram_size, count), dtype=numpy.uint16)
+        self.ram = self.state[RAM_BASE:]
+        self.cycles = numpy.zeros(count, dtype=numpy.int64)
+        self.faulted = numpy.zeros(count, dtype=bool)
+        self.everyone = numpy.arange(count)
+
+    @classmethod
+    def from_file(cls, file_path, count, ram_size=RAM_SIZE):
+        return cls(load_program(file_path), count, ram_size)
+
+    def reset(self):
+        self.state[:] = 0
+        self.cycles[:] = 0
+        self.faulted[:] = False
+
+    def set(self, address, values):
+        """Sets one RAM word in every machine to a scalar or one value per machine."""
+        self.ram[address] = values
+
+    def halted(self):
+        return self.stops[self.state[REG_PC]]
+
+    def run(self, max_cycles=None):
+        """Runs every machine until it halts, faults or ran max_cycles instructions; returns the total count."""
+        import numpy
+
+        state, stops, cycles = self.state, self.stops, self.cycles
+        start = int(cycles.sum())
+        # PC of each machine that is still running, or PARKED once it halted, faulted or used its budget
+        pcs = numpy.where(self.halted() | self.faulted, PARKED, state[REG_PC]).astype(numpy.int32)
+        if max_cycles is not None:
+            budget = cycles + max_cycles
+            pcs[cycles >= budget] = PARKED
+
+        while True:
+            pc = int(pcs.min())
+            if pc == PARKED:
+                break
+
+            columns = numpy.flatnonzero(pcs == pc)
+            if len(columns) == len(pcs):
+                columns = slice(None)  # Plain slices are much cheaper than index arrays
+            executed = self.execute(pc, columns)
+            if executed is not columns:
+                pcs[self.faulted] = PARKED
+                columns = executed
+            cycles[columns] += 1
+
+            next_pcs = state[REG_PC, columns].astype(numpy.int32)
+            parked = stops[next_pcs]
+            if max_cycles is not None:
+                parked |= cycles[columns] >= budget[columns]
+            pcs[columns] = numpy.where(parked, PARKED, next_pcs)
+
+        return int(cycles.sum()) - start
+
+    def execute(self, pc, columns):
+        # One instruction for the machines in columns, with the same semantics as Emulator.interpret;
+        # returns the columns that executed it, without any that faulted
+        import numpy
+
+        state = self.state
+        instruction = self.code[pc]
+
+        if instruction.__class__ is int:
+            state[REG_A, columns] = instruction
+            state[REG_PC, columns] = pc + 1
+            return columns
+
+        alu, reads_m, dest, jump = instruction
+        a = state[REG_A, columns].astype(numpy.int64)
+        d = state[REG_D, columns].astype(numpy.int64)
+        y = a
+
+        if reads_m or dest & DEST_M:
+            outside = a >= len(state) - RAM_BASE
+            if outside.any():
+                machines = self.everyone[columns]
+                self.faulted[machines[outside]] = True
+                inside = ~outside
+                columns, a, d = machines[inside], a[inside], d[inside]
+                y = a
+                if not len(columns):
+                    return columns
+
+            if (a == a[0]).all():
+                memory = (RAM_BASE + int(a[0]), columns)  # One RAM row when every A agrees
+            else:
+                memory = (RAM_BASE + a, self.everyone[columns])
+
+            if reads_m:
+                y = state[memory].astype(numpy.int64)
+
+        out = numpy.broadcast_to(alu(d, y), a.shape)
+
+        if dest & DEST_M:
+            state[memory] = out
+
+        if dest & DEST_D:
+            state[REG_D, columns] = out
+        if dest & DEST_A:
+            state[REG_A, columns] = out
+
+        if not jump:
+            state[REG_PC, columns] = pc + 1
+        elif jump == 7:
+            state[REG_PC, columns] = a
+        else:
+            conditions = numpy.where(out & 0x8000, JUMP_LT, numpy.where(out, JUMP_GT, JUMP_EQ))
+            state[REG_PC, columns] = numpy.where(conditions & jump, a, pc + 1)
+
+        return columns
+
+
+def parse_assignment(text):
+    address, value = text.split("=")
+    return int(address), int(value)
+
+
+def read_cases(file_path):
+    """Reads one line of ADDRESS=VALUE assignments per test case."""
+    with open(file_path, 'r') as file:
+        return [[parse_assignment(text) for text in line.split()] for line in file if line.strip()]
+
+
+def run_batch(args):
+    import numpy
+
+    if args.cases:
+        cases = read_cases(args.cases)
+    else:
+        random = numpy.random.default_rng(args.seed)
+        values = random.integers(0, 0x10000, (args.fuzz, len(args.fuzz_address)))
+        cases = [list(zip(args.fuzz_address, map(int, row))) for row in values]
+
+    batch = BatchEmulator.from_file(args.file, len(cases))
+    for address, value in args.set:
+        batch.set(address, value & 0xFFFF)
+    for column, case in enumerate(cases):
+        for address, value in case:
+            batch.ram[address, column] = value & 0xFFFF
+
+    start = time.perf_counter()
+    cycles = batch.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    halted = batch.halted()
+    for column, case in enumerate(cases):
+        inputs = " ".join(f"{address}={value}" for address, value in case)
+        outputs = " ".join(f"RAM[{address}]={batch.ram[address, column]}" for address in args.ram)
+        if batch.faulted[column]:
+            state = f"faulted at PC={batch.state[REG_PC, column]}"
+        else:
+            state = "halted" if halted[column] else "stopped"
+        print(f"{inputs}: {state} after {batch.cycles[column]} instructions {outputs}".rstrip())
+
+    faulted = int(batch.faulted.sum())
+    print(f"{len(cases)} machines, {int(halted.sum())} halted, {faulted} faulted, {cycles} instructions")
+    if elapsed > 0:
+        print(f"{cycles / elapsed / 1e6:.2f} million instructions per second")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Hack machine code.")
+    parser.add_argument('file', help=".hack or .rom file")
+    parser.add_argument('-n', '--cycles', type=int, help="stop after this many instructions")
+    parser.add_argument('--blocks', action='store_true', help="compile basic blocks instead of interpreting")
+    parser.add_argument('--set', type=parse_assignment, action='append', default=[], metavar="ADDRESS=VALUE",
+                        help="initial RAM contents")
+    parser.add_argument('--ram', type=int, action='append', default=[], metavar="ADDRESS", help="RAM words to print")
+    parser.add_argument('--profile', action='store_true', help="count executions per ROM address and print hot spots")
+    parser.add_argument('--map', help="source map from the assembler or VM translator (default: the .map next to file)")
+    parser.add_argument('--top', type=int, default=20, help="rows per hot spot table")
+    parser.add_argument('--flamegraph', metavar="PATH", help="write folded call stacks for flamegraph tools (implies --profile)")
+    parser.add_argument('--cases', metavar="PATH", help="run one machine per line of ADDRESS=VALUE assignments in a batch")
+    parser.add_argument('--fuzz', type=int, metavar="COUNT", help="run COUNT machines with random values at the --fuzz-address words")
+    parser.add_argument('--fuzz-address', type=int, action='append', default=[], metavar="ADDRESS",
+                        help="RAM word randomized for each fuzzed machine")
+    parser.add_argument('--seed', type=int, help="random seed for --fuzz")
+    args = parser.parse_args(argv)
+
+    if args.cases or args.fuzz:
+        run_batch(args)
+        return
+
+    emulator = Emulator.from_file(args.file, args.blocks)
+    for address, value in args.set:
+        emulator.ram[address] = value & 0xFFFF
+
+    profiler = None
+    if args.profile or args.flamegraph:
+        assembler = load_assembler()
+        map_path = args.map or assembler.source_map_path(args.file)
+        source_map = assembler.load_source_map(map_path) if args.map or os.path.exists(map_path) else None
+        profiler = Profiler(emulator, source_map, os.path.splitext(os.path.basename(args.file))[0])
+
+    start = time.perf_counter()
+    cycles = profiler.run(args.cycles) if profiler else emulator.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    state = "halted" if emulator.halted() else "stopped"
+    print(f"{state} after {cycles} instructions at PC={emulator.pc}, A={emulator.a}, D={emulator.d}")
+    for address in args.ram:
+        print(f"RAM[{address}] = {emulator.ram[address]}")
+    if elapsed > 0:
+        print(f"{cycles / elapsed / 1e6:.2f} million instructions per second")
+
+    if profiler:
+        print()
+        print(profiler.report(args.top))
+
+    if args.flamegraph:
+        with open(args.flamegraph, 'w') as file:
+            file.writelines(line + "\n" for line in profiler.folded_stacks())
+        print(f"Folded stacks written to {args.flamegraph}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,926 @@
+import argparse
+import os
+import re
+import time
+from array import array
+from random import Random
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_SEARCH_PATH = [os.path.join(ROOT, "memory"), os.path.join(ROOT, "computer_architecture")]
+
+# Comments and whitespace are skipped; everything else is a name, a number, '..' or one symbol
+HDL_TOKEN = re.compile(r"//[^\n]*|/\*.*?\*/|\s+|(\.\.|\w+|.)", re.DOTALL)
+NET = re.compile(r"\bn\d+\b")
+
+
+def pins(spec):
+    """Parses "in[16] load" into {"in": 16, "load": 1}."""
+    widths = {}
+    for pin in spec.split():
+        name, _, width = pin.partition("[")
+        widths[name] = int(width[:-1]) if width else 1
+    return widths
+
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    if zx:
+        x = 0
+    if nx:
+        x ^= 0xFFFF
+    if zy:
+        y = 0
+    if ny:
+        y ^= 0xFFFF
+    out = (x + y) & 0xFFFF if f else x & y
+    return out ^ 0xFFFF if no else out
+
+
+# Chips with no .hdl file in the search path are simulated at the word level, as the Java
+# simulator does with its builtins. Each output is a Python expression over the pin values.
+COMBINATIONAL_CHIPS = {
+    "Nand": (pins("a b"), pins("out"), {"out": "1 - ({a} & {b})"}),
+    "Not": (pins("in"), pins("out"), {"out": "{in} ^ 1"}),
+    "And": (pins("a b"), pins("out"), {"out": "{a} & {b}"}),
+    "Or": (pins("a b"), pins("out"), {"out": "{a} | {b}"}),
+    "Xor": (pins("a b"), pins("out"), {"out": "{a} ^ {b}"}),
+    "Mux": (pins("a b sel"), pins("out"), {"out": "{b} if {sel} else {a}"}),
+    "DMux": (pins("in sel"), pins("a b"), {"a": "0 if {sel} else {in}", "b": "{in} if {sel} else 0"}),
+    "Not16": (pins("in[16]"), pins("out[16]"), {"out": "{in} ^ 0xFFFF"}),
+    "And16": (pins("a[16] b[16]"), pins("out[16]"), {"out": "{a} & {b}"}),
+    "Or16": (pins("a[16] b[16]"), pins("out[16]"), {"out": "{a} | {b}"}),
+    "Mux16": (pins("a[16] b[16] sel"), pins("out[16]"), {"out": "{b} if {sel} else {a}"}),
+    "Or8Way": (pins("in[8]"), pins("out"), {"out": "int({in} != 0)"}),
+    "Mux4Way16": (pins("a[16] b[16] c[16] d[16] sel[2]"), pins("out[16]"),
+                  {"out": "({a}, {b}, {c}, {d})[{sel}]"}),
+    "Mux8Way16": (pins("a[16] b[16] c[16] d[16] e[16] f[16] g[16] h[16] sel[3]"), pins("out[16]"),
+                  {"out": "({a}, {b}, {c}, {d}, {e}, {f}, {g}, {h})[{sel}]"}),
+    "DMux4Way": (pins("in sel[2]"), pins("a b c d"),
+                 {name: f"{{in}} if {{sel}} == {index} else 0" for index, name in enumerate("abcd")}),
+    "DMux8Way": (pins("in sel[3]"), pins("a b c d e f g h"),
+                 {name: f"{{in}} if {{sel}} == {index} else 0" for index, name in enumerate("abcdefgh")}),
+    "HalfAdder": (pins("a b"), pins("sum carry"), {"sum": "{a} ^ {b}", "carry": "{a} & {b}"}),
+    "FullAdder": (pins("a b c"), pins("sum carry"), {"sum": "{a} ^ {b} ^ {c}", "carry": "({a} + {b} + {c}) >> 1"}),
+    "Add16": (pins("a[16] b[16]"), pins("out[16]"), {"out": "({a} + {b}) & 0xFFFF"}),
+    "Inc16": (pins("in[16]"), pins("out[16]"), {"out": "({in} + 1) & 0xFFFF"}),
+    "ALU": (pins("x[16] y[16] zx nx zy ny f no"), pins("out[16] zr ng"),
+            {"out": "alu({x}, {y}, {zx}, {nx}, {zy}, {ny}, {f}, {no})", "zr": "int({out} == 0)", "ng": "{out} >> 15"}),
+}
+
+# Clocked chips holding one word: out is the state, and the expression is the next state
+REGISTER_CHIPS = {
+    "DFF": (pins("in"), "{in}"),
+    "Bit": (pins("in load"), "{in} if {load} else {out}"),
+    "Register": (pins("in[16] load"), "{in} if {load} else {out}"),
+    "ARegister": (pins("in[16] load"), "{in} if {load} else {out}"),
+    "DRegister": (pins("in[16] load"), "{in} if {load} else {out}"),
+    "PC": (pins("in[16] load inc reset"), "0 if {reset} else {in} if {load} else ({out} + 1) & 0xFFFF if {inc} else {out}"),
+}
+
+# Memories: (inputs, words); out reads the addressed word, load writes it on the clock
+MEMORY_CHIPS = {
+    "RAM8": (pins("in[16] load address[3]"), 8),
+    "RAM64": (pins("in[16] load address[6]"), 64),
+    "RAM512": (pins("in[16] load address[9]"), 512),
+    "RAM4K": (pins("in[16] load address[12]"), 4096),
+    "RAM16K": (pins("in[16] load address[14]"), 16384),
+    "Screen": (pins("in[16] load address[13]"), 8192),
+    "Keyboard": ({}, 1),
+}
+
+# Chips simulated by their word-level model even though their HDL is in the tree. At gate level
+# RAM16K alone is 262K DFFs; check_equivalence() verifies the models against the gates.
+BEHAVIORAL_MODELS = ("Register", "RAM8", "RAM64", "RAM512", "RAM4K", "RAM16K")
+
+
+class ChipDefinition:
+    """A chip parsed from HDL: input and output pin widths and its parts' connections.
+
+    Each part is (name, connections); each connection is (pin, pin_range, signal, signal_range),
+    where a range is (low, high) or None for the whole bus.
+    """
+
+    def __init__(self, name, inputs, outputs, parts):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parts = parts
+
+
+class HDLParser:
+    def __init__(self, source):
+        self.tokens = [token for token in HDL_TOKEN.findall(source) if token]
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of HDL")
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        token = self.next()
+        if token != value:
+            raise ValueError(f"Expected '{value}' in HDL, got '{token}'")
+
+    def parse_chip(self):
+        self.expect("CHIP")
+        name = self.next()
+        self.expect("{")
+
+        inputs = self.parse_pins("IN") if self.peek() == "IN" else {}
+        outputs = self.parse_pins("OUT") if self.peek() == "OUT" else {}
+
+        if self.peek() != "PARTS":
+            raise ValueError(f"Chip {name} has no PARTS section; builtin chips are not read from HDL")
+
+        self.expect("PARTS")
+        self.expect(":")
+
+        parts = []
+        while self.peek() != "}":
+            parts.append(self.parse_part())
+
+        self.expect("}")
+        return ChipDefinition(name, inputs, outputs, parts)
+
+    def parse_pins(self, keyword):
+        self.expect(keyword)
+        widths = {}
+
+        while True:
+            name = self.next()
+            width = 1
+            if self.peek() == "[":
+                self.next()
+                width = int(self.next())
+                self.expect("]")
+            widths[name] = width
+
+            if self.next() == ";":
+                return widths
+
+    def parse_range(self):
+        if self.peek() != "[":
+            return None
+
+        self.next()
+        low = high = int(self.next())
+        if self.peek() == "..":
+            self.next()
+            high = int(self.next())
+        self.expect("]")
+        return low, high
+
+    def parse_part(self):
+        name = self.next()
+        self.expect("(")
+        connections = []
+
+        while True:
+            pin = self.next()
+            pin_range = self.parse_range()
+            self.expect("=")
+            signal = self.next()
+            signal_range = self.parse_range()
+            connections.append((pin, pin_range, signal, signal_range))
+
+            if self.next() == ")":
+                break
+
+        self.expect(";")
+        return name, connections
+
+
+def parse_hdl(source):
+    return HDLParser(source).parse_chip()
+
+
+def mask(width):
+    return (1 << width) - 1
+
+
+def place(value, source_range, target_low):
+    """An expression for source_range of value shifted up to start at bit target_low."""
+    if source_range is not None:
+        low, high = source_range
+        value = f"(({value} >> {low}) & {mask(high - low + 1)})" if low else f"({value} & {mask(high + 1)})"
+    return f"({value} << {target_low})" if target_low else value
+
+
+class Netlist:
+    """Flattens a chip hierarchy into one assignment per net, then compiles it to Python.
+
+    Every bus is one integer-valued net. Registers read their state from a flat list and
+    compute their next state into another; memories are arrays written on the clock. Chips
+    named in models use their builtin model instead of their HDL.
+    """
+
+    def __init__(self, search_path, models=()):
+        self.search_path = search_path
+        self.models = set(models)
+        self.definitions = {}
+        self.assignments = {}  # Net to expression
+        self.registers = []    # Next-state expressions
+        self.memories = []     # Words in each memory
+        self.writes = []       # (memory index, address, load, value) expressions
+
+    def definition(self, name):
+        """The parsed HDL for a chip, or None when it is a builtin."""
+        if name not in self.definitions:
+            self.definitions[name] = None
+            for directory in self.search_path:
+                path = os.path.join(directory, name + ".hdl")
+                if os.path.exists(path) and os.path.getsize(path):
+                    with open(path) as file:
+                        self.definitions[name] = parse_hdl(file.read())
+                    break
+
+        return self.definitions[name]
+
+    def interface(self, name):
+        """Returns the (inputs, outputs) pin widths of a chip."""
+        definition = self.definition(name)
+
+        if definition is not None:
+            return definition.inputs, definition.outputs
+        if name in COMBINATIONAL_CHIPS:
+            return COMBINATIONAL_CHIPS[name][:2]
+        if name in REGISTER_CHIPS:
+            inputs = REGISTER_CHIPS[name][0]
+            return inputs, {"out": inputs["in"] if "in" in inputs else 16}
+        if name in MEMORY_CHIPS:
+            return MEMORY_CHIPS[name][0], pins("out[16]")
+
+        raise ValueError(f"Unknown chip {name}: no HDL file and no builtin")
+
+    def define(self, expression):
+        net = f"n{len(self.assignments)}"
+        self.assignments[net] = expression
+        return net
+
+    def flatten(self, name, inputs):
+        """Adds one instance of a chip whose input pins are the given nets; returns its output nets."""
+        definition = self.definition(name)
+
+        if definition is None or name in self.models:
+            return self.flatten_builtin(name, inputs)
+
+        env = {pin: inputs.get(pin) or self.define("0") for pin in definition.inputs}
+        drivers = {}
+
+        # Nets for every signal a part drives, so parts can refer to signals driven later
+        for part_name, connections in definition.parts:
+            part_outputs = self.interface(part_name)[1]
+            for pin, _, signal, _ in connections:
+                if pin in part_outputs and signal not in drivers:
+                    if signal in definition.inputs:
+                        raise ValueError(f"Chip {name} drives its input pin {signal}")
+                    drivers[signal] = []
+                    env[signal] = self.define(None)
+
+        for pin in definition.outputs:
+            if pin not in env:
+                drivers[pin] = []
+                env[pin] = self.define(None)
+
+        for part_name, connections in definition.parts:
+            part_inputs, part_outputs = self.interface(part_name)
+            pieces = {}
+
+            for pin, pin_range, signal, signal_range in connections:
+                if pin in part_outputs:
+                    continue
+                if pin not in part_inputs:
+                    raise ValueError(f"Chip {part_name} has no pin {pin} (in {name})")
+
+                low, high = pin_range or (0, part_inputs[pin] - 1)
+                if signal in ("true", "false"):
+                    value = str(mask(high - low + 1)) if signal == "true" else "0"
+                    pieces.setdefault(pin, []).append(f"({value} << {low})" if low else value)
+                elif signal in env:
+                    pieces.setdefault(pin, []).append(place(env[signal], signal_range, low))
+                else:
+                    raise ValueError(f"Signal {signal} in chip {name} has no driver")
+
+            part_nets = {pin: self.define(" | ".join(values)) for pin, values in pieces.items()}
+            outputs = self.flatten(part_name, part_nets)
+
+            for pin, pin_range, signal, signal_range in connections:
+                if pin in part_outputs:
+                    low = signal_range[0] if signal_range else 0
+                    drivers[signal].append(place(outputs[pin], pin_range, low))
+
+        for signal, values in drivers.items():
+            self.assignments[env[signal]] = " | ".join(values) or "0"
+
+        return {pin: env[pin] for pin in definition.outputs}
+
+    def flatten_builtin(self, name, inputs):
+        input_widths, output_widths = self.interface(name)
+        values = {pin: inputs.get(pin, "0") for pin in input_widths}
+
+        if name in COMBINATIONAL_CHIPS:
+            outputs = {}
+            for pin, expression in COMBINATIONAL_CHIPS[name][2].items():
+                outputs[pin] = self.define(expression.format(**values, **outputs))
+            return outputs
+
+        if name in REGISTER_CHIPS:
+            out = self.define(f"state[{len(self.registers)}]")
+            self.registers.append(REGISTER_CHIPS[name][1].format(**values, out=out))
+            return {"out": out}
+
+        index = len(self.memories)
+        self.memories.append(MEMORY_CHIPS[name][1])
+        address = values.get("address", "0")
+        if "load" in values:
+            self.writes.append((index, address, values["load"], values["in"]))
+        return {"out": self.define(f"memories[{index}][{address}]")}
+
+    def ordered(self, roots):
+        """Nets the roots depend on, dependencies first; only these are computed."""
+        order = []
+        done = set()
+        visiting = set()
+
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                net, expanded = stack.pop()
+                if expanded:
+                    visiting.discard(net)
+                    done.add(net)
+                    order.append(net)
+                    continue
+                if net in done:
+                    continue
+                if net in visiting:
+                    raise ValueError("Combinational loop in the chip")
+
+                visiting.add(net)
+                stack.append((net, True))
+                for dependency in NET.findall(self.assignments[net]):
+                    if dependency not in done:
+                        stack.append((dependency, False))
+
+        return order
+
+    def straight_line(self, expressions):
+        """Assignments for the nets these expressions need, in order, with aliases folded away.
+
+        Returns the code lines and a function that rewrites an expression in terms of the
+        nets that were kept.
+        """
+        resolved = {}  # Nets replaced by the net or constant they are equal to
+
+        def substitute(expression):
+            return NET.sub(lambda match: resolved.get(match.group(), match.group()), expression)
+
+        roots = [net for expression in expressions for net in NET.findall(expression)]
+        lines = []
+
+        for net in self.ordered(roots):
+            expression = substitute(self.assignments[net])
+            if NET.fullmatch(expression) or expression.isdigit() or expression == "ONES":
+                resolved[net] = expression  # An alias: no code of its own
+            else:
+                lines.append(f"    {net} = {expression}")
+
+        return lines, substitute
+
+    def compile(self, output_nets):
+        """Generates evaluate(inputs, state, pending, writes, memories) and clock(...) functions."""
+        expressions = list(output_nets) + self.registers
+        expressions += [part for write in self.writes for part in write[1:]]
+        lines, substitute = self.straight_line(expressions)
+        lines.insert(0, "def evaluate(inputs, state, pending, writes, memories):")
+
+        for index, expression in enumerate(self.registers):
+            lines.append(f"    pending[{index}] = {substitute(expression)}")
+
+        for index, (_, address, load, value) in enumerate(self.writes):
+            lines.append(f"    writes[{2 * index}] = {substitute(address)} if {substitute(load)} else -1")
+            lines.append(f"    writes[{2 * index + 1}] = {substitute(value)}")
+
+        lines.append(f"    return ({''.join(substitute(net) + ', ' for net in output_nets)})")
+
+        lines.append("def clock(state, pending, writes, memories):")
+        lines.append("    state[:] = pending")
+        for index, (memory, _, _, _) in enumerate(self.writes):
+            lines.append(f"    if writes[{2 * index}] >= 0:")
+            lines.append(f"        memories[{memory}][writes[{2 * index}]] = writes[{2 * index + 1}]")
+
+        namespace = {"alu": alu}
+        exec("\n".join(lines), namespace)
+        return namespace["evaluate"], namespace["clock"], len(lines)
+
+
+class HardwareSimulator:
+    """Simulates a chip from its HDL, compiled once into straight-line Python per clock cycle."""
+
+    def __init__(self, chip_name, search_path=None, models=BEHAVIORAL_MODELS):
+        netlist = Netlist(search_path or DEFAULT_SEARCH_PATH, models)
+        input_widths, output_widths = netlist.interface(chip_name)
+
+        inputs = {pin: netlist.define(f"inputs[{index}]") for index, pin in enumerate(input_widths)}
+        outputs = netlist.flatten(chip_name, inputs)
+
+        self.input_widths = input_widths
+        self.output_names = list(output_widths)
+        self.evaluate_function, self.clock_function, self.code_lines = netlist.compile(
+            [outputs[pin] for pin in self.output_names])
+
+        self.inputs = [0] * len(input_widths)
+        self.input_index = {pin: index for index, pin in enumerate(input_widths)}
+        self.state = [0] * len(netlist.registers)
+        self.pending = [0] * len(netlist.registers)
+        self.writes = [-1, 0] * len(netlist.writes)
+        self.memories = [array('H', bytes(2 * words)) for words in netlist.memories]
+        self.outputs = None
+
+    def set(self, pin, value):
+        self.inputs[self.input_index[pin]] = value & mask(self.input_widths[pin])
+
+    def evaluate(self):
+        """Computes every output from the current inputs and state."""
+        self.outputs = self.evaluate_function(self.inputs, self.state, self.pending, self.writes, self.memories)
+        return self.outputs
+
+    def tick(self):
+        """One full clock cycle: registers and memories take the values computed from the inputs."""
+        self.evaluate_function(self.inputs, self.state, self.pending, self.writes, self.memories)
+        self.clock_function(self.state, self.pending, self.writes, self.memories)
+
+    def get(self, pin):
+        return self.evaluate()[self.output_names.index(pin)]
+
+
+def check_equivalence(chip_name, cycles=1000, seed=None, search_path=None):
+    """Runs a chip with its behavioral models and at gate level through one random trace.
+
+    Raises ValueError at the first cycle where their outputs differ; returns the cycles checked.
+    Inputs mostly repeat a few values per pin, so memory reads hit words written earlier.
+    """
+    fast = HardwareSimulator(chip_name, search_path)
+    gates = HardwareSimulator(chip_name, search_path, models=())
+    random = Random(seed)
+    pools = {pin: [random.getrandbits(width) for _ in range(4)] for pin, width in fast.input_widths.items()}
+
+    for cycle in range(cycles):
+        for pin, width in fast.input_widths.items():
+            value = random.choice(pools[pin]) if random.random() < 0.75 else random.getrandbits(width)
+            fast.set(pin, value)
+            gates.set(pin, value)
+
+        for pin, model_value, gate_value in zip(fast.output_names, fast.evaluate(), gates.evaluate()):
+            if model_value != gate_value:
+                raise ValueError(f"{chip_name} differs from its gates at cycle {cycle}: "
+                                 f"{pin} is {model_value}, gates give {gate_value}")
+
+        fast.tick()
+        gates.tick()
+
+    return cycles
+
+
+# Batch mode: every bus bit is a lane holding that bit for many independent copies of the chip,
+# one per bit position in the lane, so each gate runs once across all of them. Lanes are Python
+# ints of any length or NumPy uint64 arrays; ONES is the all-ones lane.
+
+def bit_mux_tree(net, inputs, select):
+    """Selects inputs[select] bit by bit with a tree of multiplexers."""
+    for bit in select:
+        inputs = [[net.mux(a, b, bit) for a, b in zip(low, high)] for low, high in zip(inputs[::2], inputs[1::2])]
+    return inputs[0]
+
+
+def bit_decode(net, value, select):
+    """Routes value to output number select, as a DMux4Way or DMux8Way does."""
+    outputs = [value]
+    for bit in reversed(select):
+        inverse = net.not_(bit)
+        outputs = [routed for output in outputs for routed in (net.and_(output, inverse), net.and_(output, bit))]
+    return outputs
+
+
+def bit_add(net, a, b):
+    """Ripple-carry sum of two buses, dropping the final carry."""
+    carry = "0"
+    total = []
+    for x, y in zip(a, b):
+        partial = net.xor(x, y)
+        total.append(net.xor(partial, carry))
+        carry = net.or_(net.and_(x, y), net.and_(carry, partial))
+    return total
+
+
+def bit_alu(net, p):
+    x = [net.xor(net.and_(bit, net.not_(p["zx"][0])), p["nx"][0]) for bit in p["x"]]
+    y = [net.xor(net.and_(bit, net.not_(p["zy"][0])), p["ny"][0]) for bit in p["y"]]
+    total = bit_add(net, x, y)
+    out = [net.xor(net.mux(net.and_(a, b), s, p["f"][0]), p["no"][0]) for a, b, s in zip(x, y, total)]
+    return {"out": out, "zr": [net.not_(net.or_any(out))], "ng": [out[15]]}
+
+
+def bit_full_adder(net, a, b, c):
+    partial = net.xor(a, b)
+    return {"sum": [net.xor(partial, c)], "carry": [net.or_(net.and_(a, b), net.and_(c, partial))]}
+
+
+def bitwise(operation, *pins):
+    # A chip applying one two-input gate to each bit of its buses
+    return lambda net, p: {"out": [operation(net, *bits) for bits in zip(*(p[pin] for pin in pins))]}
+
+
+BIT_CHIPS = {
+    "Nand": lambda net, p: {"out": [net.not_(net.and_(p["a"][0], p["b"][0]))]},
+    "Not": lambda net, p: {"out": [net.not_(p["in"][0])]},
+    "And": bitwise(lambda net, a, b: net.and_(a, b), "a", "b"),
+    "Or": bitwise(lambda net, a, b: net.or_(a, b), "a", "b"),
+    "Xor": bitwise(lambda net, a, b: net.xor(a, b), "a", "b"),
+    "Mux": lambda net, p: {"out": [net.mux(p["a"][0], p["b"][0], p["sel"][0])]},
+    "DMux": lambda net, p: dict(zip("ab", bit_decode(net, p["in"][0], p["sel"]))),
+    "Not16": lambda net, p: {"out": [net.not_(bit) for bit in p["in"]]},
+    "And16": bitwise(lambda net, a, b: net.and_(a, b), "a", "b"),
+    "Or16": bitwise(lambda net, a, b: net.or_(a, b), "a", "b"),
+    "Mux16": lambda net, p: {"out": [net.mux(a, b, p["sel"][0]) for a, b in zip(p["a"], p["b"])]},
+    "Or8Way": lambda net, p: {"out": [net.or_any(p["in"])]},
+    "Mux4Way16": lambda net, p: {"out": bit_mux_tree(net, [p[pin] for pin in "abcd"], p["sel"])},
+    "Mux8Way16": lambda net, p: {"out": bit_mux_tree(net, [p[pin] for pin in "abcdefgh"], p["sel"])},
+    "DMux4Way": lambda net, p: {pin: [bit] for pin, bit in zip("abcd", bit_decode(net, p["in"][0], p["sel"]))},
+    "DMux8Way": lambda net, p: {pin: [bit] for pin, bit in zip("abcdefgh", bit_decode(net, p["in"][0], p["sel"]))},
+    "HalfAdder": lambda net, p: bit_full_adder(net, p["a"][0], p["b"][0], "0"),
+    "FullAdder": lambda net, p: bit_full_adder(net, p["a"][0], p["b"][0], p["c"][0]),
+    "Add16": lambda net, p: {"out": bit_add(net, p["a"], p["b"])},
+    "Inc16": lambda net, p: {"out": bit_add(net, p["in"], ["ONES"] + ["0"] * 15)},
+    "ALU": bit_alu,
+}
+
+
+def bit_register_next(net, name, p, out):
+    """Next-state bits of a builtin register chip."""
+    if name == "DFF":
+        return p["in"]
+    if name != "PC":
+        return [net.mux(bit, new, p["load"][0]) for bit, new in zip(out, p["in"])]
+
+    incremented = [net.mux(bit, new, p["inc"][0]) for bit, new in zip(out, bit_add(net, out, ["ONES"] + ["0"] * 15))]
+    loaded = [net.mux(bit, new, p["load"][0]) for bit, new in zip(incremented, p["in"])]
+    return [net.and_(bit, net.not_(p["reset"][0])) for bit in loaded]
+
+
+class BitNetlist(Netlist):
+    """A Netlist with one net per bus bit, evaluated on lanes of packed test vectors."""
+
+    # Gates with their constant cases folded; each returns a net or the constant "0" or "ONES"
+
+    def not_(self, a):
+        if a == "0" or a == "ONES":
+            return "ONES" if a == "0" else "0"
+        return self.define(f"{a} ^ ONES")
+
+    def and_(self, a, b):
+        if a == "0" or b == "0":
+            return "0"
+        if a == "ONES" or a == b:
+            return b
+        return a if b == "ONES" else self.define(f"{a} & {b}")
+
+    def or_(self, a, b):
+        if a == "ONES" or b == "ONES":
+            return "ONES"
+        if a == "0" or a == b:
+            return b
+        return a if b == "0" else self.define(f"{a} | {b}")
+
+    def xor(self, a, b):
+        if a == "0":
+            return b
+        if b == "0":
+            return a
+        if a == "ONES" or b == "ONES":
+            return self.not_(b if a == "ONES" else a)
+        return "0" if a == b else self.define(f"{a} ^ {b}")
+
+    def mux(self, a, b, select):
+        if select == "0" or a == b:
+            return a
+        if select == "ONES":
+            return b
+        return self.define(f"{a} ^ (({a} ^ {b}) & {select})")
+
+    def or_any(self, bits):
+        result = "0"
+        for bit in bits:
+            result = self.or_(result, bit)
+        return result
+
+    def flatten(self, name, inputs):
+        """Adds one instance of a chip whose input pins are lists of bit nets; returns its output bits."""
+        definition = self.definition(name)
+
+        if definition is None or name in self.models:
+            return self.flatten_builtin(name, inputs)
+
+        env = {pin: inputs.get(pin) or ["0"] * width for pin, width in definition.inputs.items()}
+        widths = dict(definition.outputs)
+
+        for part_name, connections in definition.parts:
+            part_outputs = self.interface(part_name)[1]
+            for pin, pin_range, signal, signal_range in connections:
+                if pin in part_outputs:
+                    if signal in definition.inputs:
+                        raise ValueError(f"Chip {name} drives its input pin {signal}")
+                    low, high = pin_range or (0, part_outputs[pin] - 1)
+                    top = signal_range[1] + 1 if signal_range else high - low + 1
+                    widths[signal] = max(widths.get(signal, 0), top)
+
+        # Nets for every driven signal up front, so parts can refer to signals driven later
+        for signal, width in widths.items():
+            env[signal] = [self.define("0") for _ in range(width)]
+
+        for part_name, connections in definition.parts:
+            part_inputs, part_outputs = self.interface(part_name)
+            part_nets = {}
+
+            for pin, pin_range, signal, signal_range in connections:
+                if pin in part_outputs:
+                    continue
+                if pin not in part_inputs:
+                    raise ValueError(f"Chip {part_name} has no pin {pin} (in {name})")
+
+                low, high = pin_range or (0, part_inputs[pin] - 1)
+                bits = part_nets.setdefault(pin, ["0"] * part_inputs[pin])
+
+                if signal in ("true", "false"):
+                    source = ["ONES" if signal == "true" else "0"] * (high - low + 1)
+                elif signal in env:
+                    source = env[signal][signal_range[0]:signal_range[1] + 1] if signal_range else env[signal]
+                else:
+                    raise ValueError(f"Signal {signal} in chip {name} has no driver")
+
+                bits[low:high + 1] = source[:high - low + 1]
+
+            outputs = self.flatten(part_name, part_nets)
+
+            for pin, pin_range, signal, signal_range in connections:
+                if pin in part_outputs:
+                    source = outputs[pin][pin_range[0]:pin_range[1] + 1] if pin_range else outputs[pin]
+                    low = signal_range[0] if signal_range else 0
+                    for offset, bit in enumerate(source):
+                        self.assignments[env[signal][low + offset]] = bit
+
+        return {pin: env[pin] for pin in definition.outputs}
+
+    def flatten_builtin(self, name, inputs):
+        input_widths, output_widths = self.interface(name)
+        p = {pin: inputs.get(pin) or ["0"] * width for pin, width in input_widths.items()}
+
+        if name in BIT_CHIPS:
+            return BIT_CHIPS[name](self, p)
+
+        if name in REGISTER_CHIPS:
+            start = len(self.registers)
+            out = [self.define(f"state[{start + bit}]") for bit in range(output_widths["out"])]
+            self.registers.extend(out)  # Placeholders, so the next state can refer to out
+            self.registers[start:] = bit_register_next(self, name, p, out)
+            return {"out": out}
+
+        raise ValueError(f"Chip {name} has memory and can't be simulated in batch mode")
+
+    def compile(self, output_nets):
+        """Generates evaluate(inputs, state, pending, ONES) returning the output lanes."""
+        lines, substitute = self.straight_line(output_nets + self.registers)
+        lines.insert(0, "def evaluate(inputs, state, pending, ONES):")
+
+        for index, expression in enumerate(self.registers):
+            lines.append(f"    pending[{index}] = {substitute(expression)}")
+
+        lines.append(f"    return [{', '.join(substitute(net) for net in output_nets)}]")
+
+        namespace = {}
+        exec("\n".join(lines), namespace)
+        return namespace["evaluate"], len(lines)
+
+
+def pack_bit(values, bit):
+    """A lane holding the given bit of each value, the first value in the lowest bit."""
+    return int("".join("1" if value >> bit & 1 else "0" for value in reversed(values)), 2)
+
+
+class BatchSimulator:
+    """Simulates count independent copies of a chip at once, bit-sliced across lanes.
+
+    Copy v sees bit v of every lane. Inputs and outputs are lists of one value per copy, or a
+    single value for all of them; check() compares whole lanes without unpacking.
+    """
+
+    def __init__(self, chip_name, count=64, search_path=None, use_numpy=False):
+        netlist = BitNetlist(search_path or DEFAULT_SEARCH_PATH)
+        input_widths, output_widths = netlist.interface(chip_name)
+
+        inputs = {}
+        index = 0
+        for pin, width in input_widths.items():
+            inputs[pin] = [netlist.define(f"inputs[{index + bit}]") for bit in range(width)]
+            index += width
+
+        outputs = netlist.flatten(chip_name, inputs)
+
+        self.input_widths = input_widths
+        self.output_widths = output_widths
+        self.input_offsets = {}
+        offset = 0
+        for pin, width in input_widths.items():
+            self.input_offsets[pin] = offset
+            offset += width
+
+        self.output_offsets = {}
+        offset = 0
+        for pin, width in output_widths.items():
+            self.output_offsets[pin] = offset
+            offset += width
+
+        self.evaluate_function, self.code_lines = netlist.compile(
+            [bit for pin in output_widths for bit in outputs[pin]])
+        self.register_count = len(netlist.registers)
+        self.use_numpy = use_numpy
+        self.reset(count)
+
+    def lane(self, value):
+        """Converts a lane held as a Python int to the working representation."""
+        if not self.use_numpy:
+            return value
+
+        import numpy
+        words = (self.count + 63) // 64
+        return numpy.frombuffer(value.to_bytes(words * 8, 'little'), dtype='<u8').copy()
+
+    def lane_value(self, lane):
+        """Converts a lane back to a Python int."""
+        return lane if isinstance(lane, int) else int.from_bytes(lane.tobytes(), 'little')
+
+    def pack(self, values, width):
+        """Lanes as Python ints for each bit of a list of per-copy values."""
+        if not self.use_numpy:
+            return [pack_bit(values, bit) for bit in range(width)]
+
+        import numpy
+        values = numpy.asarray(values, dtype=numpy.uint32)
+        return [int.from_bytes(numpy.packbits((values >> bit & 1).astype(numpy.uint8), bitorder='little').tobytes(),
+                               'little') for bit in range(width)]
+
+    def reset(self, count):
+        """Starts count copies, with every input and register at 0."""
+        self.count = count
+        self.ones_value = mask(count)
+        self.ones = self.lane(self.ones_value)
+        self.inputs = [0] * sum(self.input_widths.values())
+        self.state = [0] * self.register_count
+        self.pending = [0] * self.register_count
+        self.outputs = None
+
+    def set(self, pin, values):
+        """Sets an input pin to one value for every copy, or to a list of values, one per copy."""
+        offset = self.input_offsets[pin]
+        width = self.input_widths[pin]
+
+        if isinstance(values, int):
+            lanes = [self.ones if values >> bit & 1 else 0 for bit in range(width)]
+        else:
+            lanes = [self.lane(lane) for lane in self.pack(values, width)]
+
+        self.inputs[offset:offset + width] = lanes
+        self.outputs = None
+
+    def sweep(self, pins):
+        """Restarts with one copy per combination of the given pins' values; returns the count.
+
+        Copy v gets the bits of v, the first pin in the low bits. Other inputs are 0.
+        """
+        total = sum(self.input_widths[pin] for pin in pins)
+        self.reset(1 << total)
+        position = 0
+
+        for pin in pins:
+            offset = self.input_offsets[pin]
+            for bit in range(self.input_widths[pin]):
+                # Bit `position` of the copy number: runs of 2**position zeros then ones
+                run = 1 << position
+                period = mask(run) << run
+                repeat = mask(self.count) // mask(2 * run)
+                self.inputs[offset + bit] = self.lane(period * repeat)
+                position += 1
+
+        self.outputs = None
+        return self.count
+
+    def evaluate(self):
+        self.outputs = self.evaluate_function(self.inputs, self.state, self.pending, self.ones)
+        return self.outputs
+
+    def tick(self):
+        """One clock cycle for every copy."""
+        self.evaluate_function(self.inputs, self.state, self.pending, self.ones)
+        self.state, self.pending = self.pending, self.state
+        self.outputs = None  # Outputs of the old state
+
+    def output_lanes(self, pin):
+        # Evaluated on the first read after an input or the state changes
+        if self.outputs is None:
+            self.evaluate()
+        offset = self.output_offsets[pin]
+        return [self.lane_value(lane) for lane in self.outputs[offset:offset + self.output_widths[pin]]]
+
+    def get(self, pin):
+        """The output pin's value in each copy."""
+        values = [0] * self.count
+        for bit, lane in enumerate(self.output_lanes(pin)):
+            for copy, flag in enumerate(reversed(format(lane, f"0{self.count}b"))):
+                if flag == "1":
+                    values[copy] |= 1 << bit
+        return values
+
+    def check(self, pin, expected):
+        """Index of the first copy whose output differs from expected (a list or one value), or None."""
+        lanes = self.output_lanes(pin)
+
+        if isinstance(expected, int):
+            wanted = [self.ones_value if expected >> bit & 1 else 0 for bit in range(len(lanes))]
+        else:
+            wanted = self.pack(expected, len(lanes))
+
+        mismatches = 0
+        for lane, wanted_lane in zip(lanes, wanted):
+            mismatches |= lane ^ wanted_lane
+
+        return (mismatches & -mismatches).bit_length() - 1 if mismatches else None
+
+
+def parse_assignment(text):
+    pin, value = text.split("=")
+    return pin, int(value, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate an HDL chip.")
+    parser.add_argument('chip', help="chip name, found in the search path")
+    parser.add_argument('-I', '--include', action='append', default=[], help="directory to search for .hdl files")
+    parser.add_argument('--set', type=parse_assignment, action='append', default=[], metavar="PIN=VALUE",
+                        help="input pin values")
+    parser.add_argument('-n', '--ticks', type=int, default=0, help="clock cycles to run before printing outputs")
+    parser.add_argument('--sweep', action='append', default=[], metavar="PIN",
+                        help="evaluate every combination of these input pins at once in batch mode")
+    parser.add_argument('--numpy', action='store_true', help="use NumPy uint64 lanes in batch mode")
+    parser.add_argument('--gates', action='store_true', help="simulate every chip from its HDL, with no behavioral models")
+    parser.add_argument('--check', type=int, metavar="CYCLES",
+                        help="compare the behavioral models with the gates on a random trace")
+    args = parser.parse_args(argv)
+    search_path = args.include + DEFAULT_SEARCH_PATH
+
+    if args.check:
+        check_equivalence(args.chip, args.check, search_path=search_path)
+        print(f"{args.chip} matches its gate-level version for {args.check} cycles")
+        return
+
+    if args.sweep:
+        batch = BatchSimulator(args.chip, search_path=search_path, use_numpy=args.numpy)
+        count = batch.sweep(args.sweep)
+        for pin, value in args.set:
+            batch.set(pin, value)
+
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            batch.tick()
+        batch.evaluate()
+        elapsed = time.perf_counter() - start
+
+        print(f"Evaluated {count} combinations of {', '.join(args.sweep)} in {elapsed * 1000:.1f} ms "
+              f"({elapsed / count * 1e9:.0f} ns each)")
+        return
+
+    start = time.perf_counter()
+    simulator = HardwareSimulator(args.chip, search_path, () if args.gates else BEHAVIORAL_MODELS)
+    print(f"Compiled {args.chip} into {simulator.code_lines} lines with {len(simulator.state)} registers "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    for pin, value in args.set:
+        simulator.set(pin, value)
+
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        simulator.tick()
+    elapsed = time.perf_counter() - start
+
+    for pin, value in zip(simulator.output_names, simulator.evaluate()):
+        print(f"{pin} = {value}")
+    if args.ticks:
+        print(f"{elapsed / args.ticks * 1e6:.1f} microseconds per clock cycle")
+
+
+if __name__ == "__main__":
+    main()
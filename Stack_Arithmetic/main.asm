@@ -2,8 +2,7 @@
 @256
 D=A
 @SP
-M=D  // Set stack pointer (SP) to 256
-
+M=D
 // push constant 10
 @10
 D=A
@@ -11,8 +10,7 @@ D=A
 A=M
 M=D
 @SP
-M=M+1  // Increment SP after pushing 10
-
+M=M+1
 // push constant 20
 @20
 D=A
@@ -20,21 +18,89 @@ D=A
 A=M
 M=D
 @SP
-M=M+1  // Increment SP after pushing 20
-
+M=M+1
+// push constant 30
+@30
+D=A
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// add
+@SP
+AM=M-1
+D=M
+A=A-1
+M=D+M
+// sub
+@SP
+AM=M-1
+D=M
+A=A-1
+M=M-D
 // pop local 0
 @LCL
-D=M         // Get the base address of LCL
-@0          // Load the index (0)
-A=D+A       // Compute the address of local[0]
-D=A         // Store the computed address in D
-@R13        // Store it in temporary register R13
-M=D
-
-@SP
-M=M-1       // Decrement SP to point to the top value (20)
-A=M         // Set A to the current top of the stack
-D=M         // Store the value to be popped in D
-@R13        // Get the address of local[0]
-A=M         // Set A to point to local[0]
-M=D         // Store the popped value at local[0]
+D=M
+@0
+D=D+A
+@R13
+M=D
+@SP
+AM=M-1
+D=M
+@R13
+A=M
+M=D
+// push local 0
+@LCL
+D=M
+@0
+A=D+A
+D=M
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// push constant 5
+@5
+D=A
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// add
+@SP
+AM=M-1
+D=M
+A=A-1
+M=D+M
+// pop local 1
+@LCL
+D=M
+@1
+D=D+A
+@R13
+M=D
+@SP
+AM=M-1
+D=M
+@R13
+A=M
+M=D
+// push static 5
+@main.5
+D=M
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// pop static 6
+@SP
+AM=M-1
+D=M
+@main.6
+M=D
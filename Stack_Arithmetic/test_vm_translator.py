@@ -0,0 +1,35 @@
+import vm_translator
+
+
+def check_block(lines, optimize=True, shared_routines=False):
+    block = [line.split() for line in lines]
+    expected = vm_translator.run_vm(block)
+    words = vm_translator.translate_block(block, "Main", vm_translator.load_assembler(), optimize, shared_routines)
+    assert vm_translator.run_machine_code(words) == expected
+    return expected
+
+
+def test_verify_block_popping_below_its_start():
+    # let a[0] = Main.fib(12): the array base and the result were pushed before the call
+    memory = check_block(["pop temp 0", "pop pointer 1", "push temp 0", "pop that 0"])
+    that = memory[4]
+    assert memory[0] == 298 and that not in range(16) and memory[that] == memory[5]
+
+
+def test_comparisons_do_not_overflow():
+    # -32767 < 5 and 20000 > -20000, although x - y wraps around in 16 bits
+    cases = [
+        (["push constant 32767", "neg", "push constant 5", "lt"], 0xFFFF),
+        (["push constant 20000", "push constant 20000", "neg", "gt"], 0xFFFF),
+        (["push constant 20000", "neg", "push constant 20000", "gt"], 0),
+    ]
+
+    for lines, expected in cases:
+        lines = lines + ["pop static 0"]
+
+        for shared_routines in (False, True):
+            assert check_block(lines, shared_routines=shared_routines).get(16, 0) == expected
+            assert check_block(lines, optimize=False, shared_routines=shared_routines).get(16, 0) == expected
+
+        folded = list(vm_translator.fold_constants([line.split() for line in lines]))
+        assert folded[0] == ["push", "constant", str(expected)]
@@ -1,195 +1,928 @@
-def handle_push(segment, index, asm_file):
-    """Handles the 'push' command for various memory segments."""
-    if segment == "constant":
-        # For push constant X: push the value X onto the stack
-        asm_file.write(f"// push constant {index}\n")
-        asm_file.write(f"@{index}\nD=A\n@SP\nA=M\nM=D\n@SP\nM=M+1\n")
-    elif segment in ["local", "argument", "this", "that"]:
-        # For push from segments like local, argument, this, that
-        segment_dict = {
-            "local": "LCL",
-            "argument": "ARG",
-            "this": "THIS",
-            "that": "THAT"
-        }
-        asm_file.write(f"// push {segment} {index}\n")
-        asm_file.write(f"@{segment_dict[segment]}\nD=M\n@{index}\nA=D+A\nD=M\n")
-        asm_file.write(f"@SP\nA=M\nM=D\n@SP\nM=M+1\n")
-    elif segment == "static":
-        # For push static X
-        asm_file.write(f"// push static {index}\n")
-        asm_file.write(f"@{index}\nD=M\n@SP\nA=M\nM=D\n@SP\nM=M+1\n")
+import argparse
+import glob
+import importlib.util
+import io
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
+
+# Code templates, precomputed once and kept free of whitespace so each command is a single format call
+PUSH_D = "@SP\nA=M\nM=D\n@SP\nM=M+1\n"  # Push the value in D
+POP_D = "@SP\nAM=M-1\nD=M\n"  # Pop the top value into D
+
+SEGMENT_BASES = {
+    "local": "LCL",
+    "argument": "ARG",
+    "this": "THIS",
+    "that": "THAT"
+}
+
+# Pointer 0 is 'this', pointer 1 is 'that'
+POINTER_BASES = {
+    "0": "THIS",
+    "1": "THAT"
+}
+
+TEMP_BASE = 5
+
+PUSH_SEGMENT = "@{base}\nD=M\n@{index}\nA=D+A\nD=M\n" + PUSH_D
+PUSH_ADDRESS = "@{address}\nD=M\n" + PUSH_D
+
+POP_SEGMENT = "@{base}\nD=M\n@{index}\nD=D+A\n@R13\nM=D\n" + POP_D + "@R13\nA=M\nM=D\n"
+POP_ADDRESS = POP_D + "@{address}\nM=D\n"
+
+BINARY_OPERATION = "@SP\nAM=M-1\nD=M\nA=A-1\nM={}\n"
+UNARY_OPERATION = "@SP\nA=M-1\nM={}\n"
+
+ARITHMETIC_TEMPLATES = {
+    "add": BINARY_OPERATION.format("D+M"),
+    "sub": BINARY_OPERATION.format("M-D"),
+    "and": BINARY_OPERATION.format("D&M"),
+    "or": BINARY_OPERATION.format("D|M"),
+    "neg": UNARY_OPERATION.format("-M"),
+    "not": UNARY_OPERATION.format("!M")
+}
+
+COMPARISON_JUMPS = {
+    "eq": "JEQ",
+    "gt": "JGT",
+    "lt": "JLT"
+}
+
+# Leaves true (-1) on the stack and overwrites it with false (0) unless the jump is taken
+COMPARISON = "@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\nM=-1\n@{label}\nD;{jump}\n@SP\nA=M-1\nM=0\n({label})\n"
+
+# x - y overflows when the signs differ, so gt and lt only subtract operands of the same
+# sign; otherwise D gets a value with the sign of the answer (x itself, or 1). y is kept
+# in R13 because the peephole pass may never store it on the stack.
+SIGNED_COMPARISON = (
+    "@SP\nAM=M-1\nD=M\n@R13\nM=D\n@{label}_YNEG\nD;JLT\n"
+    "@SP\nA=M-1\nD=M\n@{label}_TEST\nD;JLT\n"  # x < 0 <= y
+    "({label}_SAME)\n@R13\nD=M\n@SP\nA=M-1\nD=M-D\n@{label}_TEST\n0;JMP\n"
+    "({label}_YNEG)\n@SP\nA=M-1\nD=M\n@{label}_SAME\nD;JLT\n"
+    "D=1\n"  # y < 0 <= x
+    "({label}_TEST)\n@SP\nA=M-1\nM=-1\n@{label}\nD;{jump}\n@SP\nA=M-1\nM=0\n({label})\n"
+)
+
+COMPARISON_TEMPLATES = {
+    "eq": COMPARISON,
+    "gt": SIGNED_COMPARISON,
+    "lt": SIGNED_COMPARISON
+}
+
+FRAME_POINTERS = ["LCL", "ARG", "THIS", "THAT"]
+PUSH_FRAME = "".join(f"@{pointer}\nD=M\n" + PUSH_D for pointer in FRAME_POINTERS)
+
+# Expects the return address in D
+CALL_FRAME = PUSH_D + PUSH_FRAME
+CALL = "@{return_label}\nD=A\n" + CALL_FRAME + "@SP\nD=M\n@{offset}\nD=D-A\n@ARG\nM=D\n@SP\nD=M\n@LCL\nM=D\n@{function}\n0;JMP\n({return_label})\n"
+
+RETURN = (
+    "@LCL\nD=M\n@R13\nM=D\n"  # R13 = frame
+    "@5\nA=D-A\nD=M\n@R14\nM=D\n"  # R14 = return address
+    + POP_D + "@ARG\nA=M\nM=D\n"  # Return value goes to argument 0
+    "@ARG\nD=M+1\n@SP\nM=D\n"
+    + "".join(f"@R13\nAM=M-1\nD=M\n@{pointer}\nM=D\n" for pointer in reversed(FRAME_POINTERS))
+    + "@R14\nA=M\n0;JMP\n"
+)
+
+# Shared routines are emitted once after the program. Call sites jump to them with the
+# return address in D, trading a few cycles per use for a much smaller ROM.
+SHARED_PREFIX = "VM$"
+HALT = f"({SHARED_PREFIX}HALT)\n@{SHARED_PREFIX}HALT\n0;JMP\n"
+
+CALL_SHARED_ROUTINE = "@{return_label}\nD=A\n@{routine}\n0;JMP\n({return_label})\n"
+CALL_SHARED_CALL = "@{arguments}\nD=A\n@R14\nM=D\n@{function}\nD=A\n@R13\nM=D\n" + CALL_SHARED_ROUTINE
+
+SHARED_ROUTINES = {
+    f"{SHARED_PREFIX}{command.upper()}": (
+        f"({SHARED_PREFIX}{command.upper()})\n@R15\nM=D\n"
+        + COMPARISON_TEMPLATES[command].format(label=f"{SHARED_PREFIX}{command.upper()}_TRUE", jump=jump)
+        + "@R15\nA=M\n0;JMP\n"
+    )
+    for command, jump in COMPARISON_JUMPS.items()
+}
+
+# Enters with the return address in D, the callee in R13 and the argument count in R14
+SHARED_ROUTINES[f"{SHARED_PREFIX}CALL"] = (
+    f"({SHARED_PREFIX}CALL)\n" + CALL_FRAME
+    + "@R14\nD=M\n@5\nD=D+A\n@SP\nD=M-D\n@ARG\nM=D\n@SP\nD=M\n@LCL\nM=D\n@R13\nA=M\n0;JMP\n"
+)
+
+SHARED_ROUTINES[f"{SHARED_PREFIX}RETURN"] = f"({SHARED_PREFIX}RETURN)\n" + RETURN
+
+# Optimization levels for translate()
+OPTIMIZE_NONE = 0
+OPTIMIZE_PEEPHOLE = 1
+OPTIMIZE_FOLD = 2  # Peephole plus compile-time constant folding
+
+def signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+# 16-bit semantics shared by the constant folder and the reference VM interpreter.
+# Comparisons are on the signed values, with no wraparound.
+BINARY_OPERATIONS = {
+    "add": lambda x, y: (x + y) & 0xFFFF,
+    "sub": lambda x, y: (x - y) & 0xFFFF,
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    "eq": lambda x, y: 0xFFFF if x == y else 0,
+    "gt": lambda x, y: 0xFFFF if signed(x) > signed(y) else 0,
+    "lt": lambda x, y: 0xFFFF if signed(x) < signed(y) else 0
+}
+
+UNARY_OPERATIONS = {
+    "neg": lambda x: -x & 0xFFFF,
+    "not": lambda x: ~x & 0xFFFF
+}
+
+FLUSH_SIZE = 4096  # Buffered code pieces per write call
+
+# Output formats: text assembly, or machine code encoded in memory without an .asm file
+OUTPUT_FORMATS = ["asm", "hack", "rom"]
+
+EMULATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Emulator", "emulator.py")
+
+
+def load_emulator():
+    """Imports Emulator/emulator.py, which lives outside this directory, once per process."""
+    if "hack_emulator" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("hack_emulator", EMULATOR_PATH)
+        emulator = importlib.util.module_from_spec(spec)
+        sys.modules["hack_emulator"] = emulator
+        spec.loader.exec_module(emulator)
+    return sys.modules["hack_emulator"]
+
+
+def load_assembler():
+    return load_emulator().load_assembler()
+
+# Peephole rules over the instruction stream: (pattern, replacement). "@*" matches any
+# A-instruction and is re-emitted as matched. Redundant "@SP" reloads are dropped before
+# the rules run, which is why the push/pop shapes below have a single "@SP" between them.
+ANY_ADDRESS = "@*"
+PUSH_POP = ("@SP", "A=M", "M=D", "@SP", "M=M+1", "AM=M-1", "D=M")
+
+PEEPHOLE_RULES = [
+    # push then pop: the value never has to touch the stack
+    (PUSH_POP + (ANY_ADDRESS,), (ANY_ADDRESS,)),
+    # push then binary operation: operate on the old top of stack directly
+    (PUSH_POP + ("A=A-1",), ("@SP", "A=M-1")),
+]
+
+for operation in ["D+M", "M-D", "D&M", "D|M"]:
+    # binary operation then pop: keep the result in D instead of storing and reloading it
+    PEEPHOLE_RULES.append((
+        ("A=A-1", f"M={operation}", "@SP", "AM=M-1", "D=M", ANY_ADDRESS),
+        ("A=A-1", f"D={operation}", "@SP", "M=M-1", ANY_ADDRESS)
+    ))
+
+for operation in ["-", "!"]:
+    # push then unary operation: apply it while pushing
+    PEEPHOLE_RULES.append((
+        ("A=M", "M=D", "@SP", "M=M+1", "A=M-1", f"M={operation}M", ANY_ADDRESS),
+        ("A=M", f"M={operation}D", "@SP", "M=M+1", ANY_ADDRESS)
+    ))
+
+PEEPHOLE_WINDOW = max(len(pattern) for pattern, _ in PEEPHOLE_RULES)
+
+
+def is_instruction(line):
+    return not line.startswith(("//", "("))
+
+
+def writes_a(line):
+    return '=' in line and 'A' in line.split('=')[0]
+
+
+class PeepholeOptimizer:
+    """Rewrites the tail of the instruction stream as it grows, removing redundant SP traffic.
+
+    Each line carries a tag alongside it; rewritten lines keep the tags of the lines they
+    replace, aligned at the end of the window.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.tags = []
+        self.instructions_in = 0
+        self.instructions_out = 0
+
+    def feed(self, line, tag=None):
+        if is_instruction(line):
+            self.instructions_in += 1
+
+        if line.startswith("@") and self.a_holds(line):
+            return
+
+        self.lines.append(line)
+        self.tags.append(tag)
+        self.rewrite()
+
+    def a_holds(self, load):
+        # True when A is already loaded with this address and nothing has changed it since
+        for line in reversed(self.lines[-PEEPHOLE_WINDOW:]):
+            if line == load:
+                return True
+            if line.startswith(("@", "(")) or writes_a(line):
+                return False
+        return False
+
+    def rewrite(self):
+        rewritten = True
+
+        while rewritten:
+            rewritten = False
+
+            for pattern, replacement in PEEPHOLE_RULES:
+                tail = self.lines[-len(pattern):]
+
+                if len(tail) != len(pattern):
+                    continue
+
+                address = None
+                for expected, line in zip(pattern, tail):
+                    if expected == ANY_ADDRESS and line.startswith("@"):
+                        address = line
+                    elif expected != line:
+                        break
+                else:
+                    tags = self.tags[len(self.tags) - len(replacement):]
+                    del self.lines[-len(pattern):]
+                    del self.tags[-len(pattern):]
+                    self.lines.extend(address if line == ANY_ADDRESS else line for line in replacement)
+                    self.tags.extend(tags)
+                    rewritten = True
+                    break
+
+    def drain(self, keep=0):
+        # Hand back every line that can no longer take part in a rewrite
+        count = max(len(self.lines) - keep, 0)
+        lines = self.lines[:count]
+        tags = self.tags[:count]
+        del self.lines[:count]
+        del self.tags[:count]
+        self.instructions_out += sum(1 for line in lines if is_instruction(line))
+        return lines, tags
+
+
+class CodeWriter:
+    """Collects generated assembly in memory and writes it out in large chunks.
+
+    With source_map, each instruction written is recorded in source_map as its .asm line
+    number, the last label, and the VM command and file in tag when it was generated.
+    """
+
+    def __init__(self, asm_file, comments=True, flush_size=FLUSH_SIZE, optimize=False, shared_routines=False,
+                 source_map=False):
+        self.asm_file = asm_file
+        self.shared_routines = shared_routines
+        self.used_routines = set()
+        self.label_count = 0
+        self.file_name = None  # Namespace for statics and generated labels
+        self.function_name = None
+        self.optimizer = PeepholeOptimizer() if optimize else None
+        self.comments = comments and not optimize  # Comments would split peephole patterns
+        self.flush_size = flush_size
+        self.buffer = []
+        self.instructions = 0
+        self.tag = ("", "")  # (VM command, .vm file) of the code being written
+        self.source_map = [] if source_map else None
+        self.line_number = 0
+        self.label = ""
+
+    def comment(self, text):
+        if self.comments:
+            self.buffer.append(f"// {text}\n")
+            self.line_number += 1
+
+    def write(self, code):
+        if self.optimizer:
+            for line in code.splitlines():
+                self.optimizer.feed(line, self.tag)
+
+            if len(self.optimizer.lines) >= self.flush_size:
+                self.emit(*self.optimizer.drain(PEEPHOLE_WINDOW))
+                self.flush()
+            return
+
+        self.buffer.append(code)
+        self.instructions += code.count('\n') - code.count('(')
+
+        if self.source_map is not None:
+            self.record(code.splitlines(), repeat(self.tag))
+
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def unique_label(self, kind):
+        # Scoped by the enclosing function (or file), so files translated apart never collide
+        self.label_count += 1
+        return f"{self.function_name or self.file_name}${kind}.{self.label_count}"
+
+    def scoped_label(self, label):
+        """Labels belong to the function they appear in."""
+        if self.function_name:
+            return f"{self.function_name}${label}"
+        return label
+
+    def call_routine(self, routine):
+        self.used_routines.add(routine)
+        self.write(CALL_SHARED_ROUTINE.format(routine=routine, return_label=self.unique_label("ret")))
+
+    def finish(self):
+        # Shared routines live after a halt loop so straight-line programs never fall into them
+        if self.used_routines:
+            self.tag = ("shared routines", "")
+            self.comment("Shared routines")
+            self.write(HALT)
+
+            for routine in sorted(self.used_routines):
+                self.write(SHARED_ROUTINES[routine])
+
+        self.flush()
+
+    def emit(self, lines, tags):
+        self.buffer.append(''.join(line + '\n' for line in lines))
+
+        if self.source_map is not None:
+            self.record(lines, tags)
+
+    def record(self, lines, tags):
+        for line, (command, source) in zip(lines, tags):
+            self.line_number += 1
+
+            if line.startswith("("):
+                self.label = line[1:-1]
+            elif line and not line.startswith("//"):
+                self.source_map.append((self.line_number, self.label, command, source))
+
+    def flush(self):
+        if self.optimizer:
+            self.emit(*self.optimizer.drain())
+
+        self.asm_file.write(''.join(self.buffer))
+        self.buffer.clear()
+
+    def write_module(self, code, source_map):
+        """Appends code another writer translated and flushed, with that writer's source map."""
+        self.asm_file.write(code)
+
+        if self.source_map is not None:
+            offset = self.line_number
+            self.source_map.extend((line + offset, label, command, source)
+                                   for line, label, command, source in source_map)
+            self.line_number += code.count('\n')
+            if source_map:
+                self.label = source_map[-1][1]
+
+    def instruction_counts(self):
+        """Returns the number of instructions generated and the number written."""
+        if self.optimizer:
+            return self.optimizer.instructions_in, self.optimizer.instructions_out
+        return self.instructions, self.instructions
+
+
+class HackEmitter:
+    """Stands in for the .asm file and encodes generated code straight into machine words.
+
+    C-instructions are looked up in the assembler's encoding table as they arrive; labels
+    and variables are resolved in memory once the whole program has been written.
+    """
+
+    def __init__(self, assembler=None):
+        self.assembler = assembler or load_assembler()
+        self.words = array('H')
+        self.labels = {}
+        self.fixups = []  # (word index, symbol) pairs waiting for an address
+
+    def write(self, code):
+        words = self.words
+        c_words = self.assembler.C_INSTRUCTION_WORDS
+
+        for line in code.splitlines():
+            if line.startswith("//"):
+                continue
+            elif line.startswith("("):
+                label = line[1:-1]
+                if label in self.labels:
+                    raise ValueError(f"Duplicate label: {label}")
+                self.labels[label] = len(words)
+            elif line.startswith("@"):
+                value = line[1:]
+
+                if value.isdigit():
+                    words.append(int(value))
+                else:
+                    self.fixups.append((len(words), value))
+                    words.append(0)
+            elif line:
+                if line not in c_words:
+                    raise ValueError(f"Invalid C-instruction: {line}")
+
+                words.append(c_words[line])
+
+    def resolve(self, symbols=()):
+        # Variables get addresses from 16 in order of first use, as in the assembler,
+        # unless symbols already places them
+        symbol_table = dict(self.assembler.PREDEFINED_SYMBOLS)
+        symbol_table.update(symbols)
+        symbol_table.update(self.labels)
+        next_available_address = 16
+
+        for index, symbol in self.fixups:
+            if symbol not in symbol_table:
+                symbol_table[symbol] = next_available_address
+                next_available_address += 1
+
+            self.words[index] = symbol_table[symbol]
+
+        self.fixups.clear()
+        return self.words
+
+    def save(self, output_path, packed=False):
+        words = self.resolve()
+
+        if packed:
+            self.assembler.write_rom_words(output_path, words)
+        else:
+            self.assembler.write_hack_file(output_path, (format(word, '016b') for word in words))
+
+
+def constant_load(value):
+    """Returns code that loads any 16-bit constant into D."""
+    value &= 0xFFFF
+
+    if value in (0, 1):
+        return f"D={value}\n"
+    elif value == 0xFFFF:
+        return "D=-1\n"
+    elif value < 0x8000:
+        return f"@{value}\nD=A\n"
+    elif value == 0x8000:
+        return "@32767\nD=A\nD=D+1\n"
+    return f"@{0x10000 - value}\nD=-A\n"
+
+
+def segment_address(segment, index, file_name):
+    """Returns the fixed RAM address of a static, temp or pointer entry."""
+    if segment == "static":
+        return f"{file_name}.{index}"
     elif segment == "temp":
-        # For push temp X
-        asm_file.write(f"// push temp {index}\n")
-        asm_file.write(f"@5\nD=A\n@{index}\nA=D+A\nD=M\n")
-        asm_file.write(f"@SP\nA=M\nM=D\n@SP\nM=M+1\n")
+        return TEMP_BASE + int(index)
     elif segment == "pointer":
-        # For push pointer X (pointer 0 is 'this', pointer 1 is 'that')
-        segment_dict = {
-            0: "THIS",
-            1: "THAT"
-        }
-        asm_file.write(f"// push pointer {index}\n")
-        asm_file.write(f"@{segment_dict[index]}\nD=M\n@SP\nA=M\nM=D\n@SP\nM=M+1\n")
+        return POINTER_BASES[index]
+
+
+def handle_push(segment, index, writer):
+    """Handles the 'push' command for various memory segments."""
+    writer.comment(f"push {segment} {index}")
+
+    if segment == "constant":
+        writer.write(constant_load(int(index)) + PUSH_D)
+    elif segment in SEGMENT_BASES:
+        writer.write(PUSH_SEGMENT.format(base=SEGMENT_BASES[segment], index=index))
+    elif segment in ["static", "temp", "pointer"]:
+        writer.write(PUSH_ADDRESS.format(address=segment_address(segment, index, writer.file_name)))
+    else:
+        raise ValueError(f"Unknown segment for push: {segment}")
 
 
-def handle_pop(segment, index, asm_file):
+def handle_pop(segment, index, writer):
     """Handles the 'pop' command for various memory segments."""
-    if segment in ["local", "argument", "this", "that"]:
-        # For pop to segments like local, argument, this, that
-        segment_dict = {
-            "local": "LCL",
-            "argument": "ARG",
-            "this": "THIS",
-            "that": "THAT"
-        }
-        
-        asm_file.write(f"// pop {segment} {index}\n")
-        asm_file.write(f"@{segment_dict[segment]}\nD=M\n@{index}\nA=D+A\nD=A\n@R13\nM=D\n")
-        asm_file.write(f"@SP\nM=M-1\nA=M\nD=M\n@R13\nA=M\nM=D\n")
-    elif segment == "static":
-        # For pop to static X
-        asm_file.write(f"// pop static {index}\n")
-        asm_file.write(f"@SP\nM=M-1\nA=M\nD=M\n@{index}\nM=D\n")
-    elif segment == "temp":
-        # For pop to temp X
-        asm_file.write(f"// pop temp {index}\n")
-        asm_file.write(f"@5\nD=A\n@{index}\nA=D+A\nD=A\n@R13\nM=D\n")
-        asm_file.write(f"@SP\nM=M-1\nA=M\nD=M\n@R13\nA=M\nM=D\n")
-    elif segment == "pointer":
-        # For pop to pointer X (pointer 0 is 'this', pointer 1 is 'that')
-        segment_dict = {
-            0: "THIS",
-            1: "THAT"
-        }
-
-        asm_file.write(f"// pop pointer {index}\n")
-        asm_file.write(f"@SP\nM=M-1\nA=M\nD=M\n@R13\nA=M\nM=D\n")
+    writer.comment(f"pop {segment} {index}")
+
+    if segment in SEGMENT_BASES:
+        writer.write(POP_SEGMENT.format(base=SEGMENT_BASES[segment], index=index))
+    elif segment in ["static", "temp", "pointer"]:
+        writer.write(POP_ADDRESS.format(address=segment_address(segment, index, writer.file_name)))
     else:
         raise ValueError(f"Unknown segment for pop: {segment}")
 
-def handle_arithmetic(command, asm_file):
+
+def handle_arithmetic(command, writer):
     """Handles arithmetic operations like add, sub, neg, eq, gt, lt, and, or, not."""
-    
-    if command == "add":
-        asm_file.write("// add\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack (second value)
-        D=M         // Store the second value in D
-        
-        @SP
-        M=M-1       // Decrement SP again to point to the next value
-        A=M         // Set A to point to the next value (first value)
-        M=D+M       // Add the values and store the result
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-    
-    elif command == "sub":
-        asm_file.write("// sub\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack (second value)
-        D=M         // Store the second value in D
-        
-        @SP
-        M=M-1       // Decrement SP again to point to the next value
-        A=M         // Set A to point to the next value (first value)
-        M=M-D       // Subtract the values and store the result
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-
-    elif command == "neg":
-        asm_file.write("// neg\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack
-        M=-M        // Negate the value
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-
-    elif command == "and":
-        asm_file.write("// and\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack (second value)
-        D=M         // Store the second value in D
-        
-        @SP
-        M=M-1       // Decrement SP again to point to the next value
-        A=M         // Set A to point to the next value (first value)
-        M=D&M       // Perform AND and store the result
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-        
-    elif command == "or":
-        asm_file.write("// or\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack (second value)
-        D=M         // Store the second value in D
-        
-        @SP
-        M=M-1       // Decrement SP again to point to the next value
-        A=M         // Set A to point to the next value (first value)
-        M=D|M       // Perform OR and store the result
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-    
-    elif command == "not":
-        asm_file.write("// not\n")
-        asm_file.write("""
-        @SP
-        M=M-1       // Decrement SP to point to the top value
-        A=M         // Set A to point to the current top of the stack
-        M=!M        // Perform bitwise NOT
-        
-        @SP
-        M=M+1       // Increment SP to point to the next available space
-        """)
-
-def translate(input_file, output_file):
-    """Reads the VM file and generates Hack assembly code."""
-    with open(input_file, 'r') as vm_file, open(output_file, 'w') as asm_file:
-        
-        # Initialize stack pointer to 256
-        asm_file.write("// Initialize stack pointer\n")
-        asm_file.write("@256\nD=A\n@SP\nM=D\n\n")
-
-        for line in vm_file:
-            line = line.strip().split('//')[0]  # Remove comments and whitespace
-            if not line:
-                continue  # Skip empty lines
-
-            tokens = line.split()  # Split the line into tokens
-            command = tokens[0]
-
-            # Handle arithmetic commands
-            if command in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]:
-                handle_arithmetic(command, asm_file)
-            # Handle push/pop commands
-            elif command == "push":
-                handle_push(tokens[1], tokens[2], asm_file)
-            elif command == "pop":
-                handle_pop(tokens[1], tokens[2], asm_file)
-
-# Example usage
-input_file = "main.vm"   # Input VM file
-output_file = "main.asm"  # Output Hack assembly file
-translate(input_file, output_file)
+    writer.comment(command)
+
+    if command in ARITHMETIC_TEMPLATES:
+        writer.write(ARITHMETIC_TEMPLATES[command])
+    elif writer.shared_routines:
+        writer.call_routine(f"{SHARED_PREFIX}{command.upper()}")
+    else:
+        template = COMPARISON_TEMPLATES[command]
+        writer.write(template.format(label=writer.unique_label("cmp"), jump=COMPARISON_JUMPS[command]))
+
+
+def handle_flow(command, label, writer):
+    """Handles the 'label', 'goto' and 'if-goto' commands."""
+    writer.comment(f"{command} {label}")
+    label = writer.scoped_label(label)
+
+    if command == "label":
+        writer.write(f"({label})\n")
+    elif command == "goto":
+        writer.write(f"@{label}\n0;JMP\n")
+    else:
+        writer.write(POP_D + f"@{label}\nD;JNE\n")
+
+
+def handle_function(function_name, local_count, writer):
+    """Handles 'function f k': the entry label followed by k zeroed locals."""
+    writer.comment(f"function {function_name} {local_count}")
+    writer.function_name = function_name
+
+    code = f"({function_name})\n"
+    if int(local_count):
+        code += "@SP\nA=M\n" + "M=0\nA=A+1\n" * int(local_count) + "D=A\n@SP\nM=D\n"
+
+    writer.write(code)
+
+
+def handle_call(function_name, argument_count, writer):
+    """Handles 'call f n': saves the caller's frame and jumps to f."""
+    writer.comment(f"call {function_name} {argument_count}")
+    return_label = writer.unique_label("ret")
+
+    if writer.shared_routines:
+        writer.used_routines.add(f"{SHARED_PREFIX}CALL")
+        writer.write(CALL_SHARED_CALL.format(arguments=argument_count, function=function_name,
+                                             routine=f"{SHARED_PREFIX}CALL", return_label=return_label))
+    else:
+        writer.write(CALL.format(return_label=return_label, offset=int(argument_count) + 5, function=function_name))
+
+
+def handle_return(writer):
+    """Handles 'return': restores the caller's frame and jumps back."""
+    writer.comment("return")
+
+    if writer.shared_routines:
+        writer.used_routines.add(f"{SHARED_PREFIX}RETURN")
+        writer.write(f"@{SHARED_PREFIX}RETURN\n0;JMP\n")
+    else:
+        writer.write(RETURN)
+
+
+def parse_vm(lines):
+    """Yields the tokens of each VM command, skipping comments and blank lines."""
+    for line in lines:
+        line = line.strip().split('//')[0]  # Remove comments and whitespace
+        if not line:
+            continue  # Skip empty lines
+
+        yield line.split()  # Split the line into tokens
+
+
+def fold_constants(commands):
+    """Evaluates arithmetic on known constants at translation time.
+
+    Constants wait on a virtual stack and are only pushed onto the real stack when a
+    command needs them there.
+    """
+    constants = []
+
+    for tokens in commands:
+        command = tokens[0]
+
+        if command == "push" and tokens[1] == "constant":
+            constants.append(int(tokens[2]) & 0xFFFF)
+            continue
+        elif command in UNARY_OPERATIONS and constants:
+            constants.append(UNARY_OPERATIONS[command](constants.pop()))
+            continue
+        elif command in BINARY_OPERATIONS and len(constants) >= 2:
+            y = constants.pop()
+            x = constants.pop()
+            constants.append(BINARY_OPERATIONS[command](x, y))
+            continue
+
+        for value in constants:
+            yield ["push", "constant", str(value)]
+        constants.clear()
+
+        yield tokens
+
+    for value in constants:
+        yield ["push", "constant", str(value)]
+
+
+CONTROL_FLOW_COMMANDS = ["label", "goto", "if-goto", "function", "call", "return"]
+
+
+def straight_line_blocks(commands):
+    """Splits a command list at control flow, which constant folding never crosses."""
+    block = []
+
+    for tokens in commands:
+        if tokens[0] in CONTROL_FLOW_COMMANDS:
+            yield block
+            block = []
+        else:
+            block.append(tokens)
+
+    yield block
+
+
+# Machine state a verified block starts from: SP, LCL, ARG, THIS and THAT, and the stack
+# below SP. A block may pop values it did not push, such as a call's result, and use them
+# as pointers, so those slots hold distinct addresses clear of the registers and segments.
+VERIFY_RAM = {0: 300, 1: 280, 2: 260, 3: 3000, 4: 4000}
+VERIFY_RAM.update((address, 5000 + address) for address in range(256, 300))
+STACK_END = 2048  # Stack slots from SP up to here are dead
+SCRATCH_REGISTERS = range(13, 16)  # R13-R15, used freely by the generated code
+
+
+def live_memory(ram):
+    """The non-zero words of a RAM dict, without dead stack slots and scratch registers."""
+    sp = ram[0]
+    return {address: value for address, value in ram.items()
+            if value and not sp <= address < STACK_END and address not in SCRATCH_REGISTERS}
+
+
+def run_vm(commands, ram=None):
+    """Interprets straight-line VM commands and returns the live memory.
+
+    This is the reference the generated code of each block is checked against.
+    """
+    ram = dict(ram or VERIFY_RAM)
+    fixed_bases = {"pointer": 3, "temp": TEMP_BASE, "static": 16}
+    base_pointers = {"local": 1, "argument": 2, "this": 3, "that": 4}
+
+    def address(segment, index):
+        if segment in fixed_bases:
+            return fixed_bases[segment] + int(index)
+        return ram.get(base_pointers[segment], 0) + int(index)
+
+    for tokens in commands:
+        command = tokens[0]
+        sp = ram[0]
+
+        if command == "push":
+            value = int(tokens[2]) & 0xFFFF if tokens[1] == "constant" else ram.get(address(tokens[1], tokens[2]), 0)
+            ram[sp] = value
+            ram[0] = sp + 1
+        elif command == "pop":
+            target = address(tokens[1], tokens[2])
+            ram[0] = sp - 1
+            ram[target] = ram.get(sp - 1, 0)
+        elif command in UNARY_OPERATIONS:
+            ram[sp - 1] = UNARY_OPERATIONS[command](ram.get(sp - 1, 0))
+        elif command in BINARY_OPERATIONS:
+            ram[sp - 2] = BINARY_OPERATIONS[command](ram.get(sp - 2, 0), ram.get(sp - 1, 0))
+            ram[0] = sp - 1
+
+    return live_memory(ram)
+
+
+def run_machine_code(words, ram=None, max_steps=100000):
+    """Runs machine code on the emulator from address 0 until it halts; returns the live memory."""
+    emulator = load_emulator().Emulator(words)
+    for address, value in (ram or VERIFY_RAM).items():
+        emulator.ram[address] = value
+
+    emulator.run(max_steps)
+    if not emulator.halted():
+        raise ValueError(f"Machine code did not halt within {max_steps} steps")
+
+    return live_memory(dict(enumerate(emulator.ram)))
+
+
+def translate_block(commands, file_name, assembler, optimize=False, shared_routines=False):
+    """Translates straight-line VM commands on their own into machine code.
+
+    Statics are placed at 16 plus their index, as the reference interpreter places them.
+    """
+    emitter = HackEmitter(assembler)
+    writer = CodeWriter(emitter, comments=False, optimize=optimize, shared_routines=shared_routines)
+    writer.file_name = file_name
+
+    translate_commands(commands, writer)
+    writer.finish()
+
+    return emitter.resolve({f"{file_name}.{index}": 16 + index for index in range(240)})
+
+
+def verify_folding(commands, folded, writer):
+    """Checks the machine code of every folded and original block against the reference interpreter."""
+    assembler = load_assembler()
+    optimize = writer.optimizer is not None
+
+    for folded_block, block in zip(straight_line_blocks(folded), straight_line_blocks(commands)):
+        expected = run_vm(block)
+
+        for translated in (folded_block, block):
+            words = translate_block(translated, writer.file_name, assembler, optimize, writer.shared_routines)
+
+            if run_machine_code(words) != expected:
+                return False
+
+    return True
+
+
+def translate_commands(commands, writer):
+    """Writes the Hack assembly for a stream of parsed VM commands."""
+    source = f"{writer.file_name}.vm"
+
+    for tokens in commands:
+        command = tokens[0]
+        writer.tag = (" ".join(tokens), source)
+
+        # Handle arithmetic commands
+        if command in ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]:
+            handle_arithmetic(command, writer)
+        # Handle push/pop commands
+        elif command == "push":
+            handle_push(tokens[1], tokens[2], writer)
+        elif command == "pop":
+            handle_pop(tokens[1], tokens[2], writer)
+        # Handle program flow and function commands
+        elif command in ["label", "goto", "if-goto"]:
+            handle_flow(command, tokens[1], writer)
+        elif command == "function":
+            handle_function(tokens[1], tokens[2], writer)
+        elif command == "call":
+            handle_call(tokens[1], tokens[2], writer)
+        elif command == "return":
+            handle_return(writer)
+        else:
+            raise ValueError(f"Unknown VM command: {command}")
+
+
+def module_name(input_file):
+    return os.path.splitext(os.path.basename(input_file))[0]
+
+
+def write_bootstrap(writer, call_sys_init=False):
+    # Initialize stack pointer to 256
+    writer.tag = ("bootstrap", "")
+    writer.comment("Initialize stack pointer")
+    writer.write("@256\nD=A\n@SP\nM=D\n")
+
+    if call_sys_init:
+        writer.file_name = "Bootstrap"
+        handle_call("Sys.init", "0", writer)
+
+
+def translate_file(input_file, writer, optimize=OPTIMIZE_NONE, verify=False):
+    """Translates one VM file through the given writer, namespaced by its file name."""
+    writer.file_name = module_name(input_file)
+    writer.function_name = None
+
+    with open(input_file, 'r') as vm_file:
+        commands = parse_vm(vm_file)
+
+        if optimize >= OPTIMIZE_FOLD:
+            if verify:
+                commands = list(commands)
+                folded = list(fold_constants(commands))
+
+                if not verify_folding(commands, folded, writer):
+                    raise ValueError(f"Generated code does not match the VM semantics in {input_file}")
+
+                commands = folded
+            else:
+                commands = fold_constants(commands)
+
+        translate_commands(commands, writer)
+
+
+def save_source_map(writer, output_file):
+    """Writes the ROM address to .asm line, label, VM command and .vm file map next to the output."""
+    assembler = load_assembler()
+    assembler.write_source_map(assembler.source_map_path(output_file), writer.source_map)
+
+
+def open_output(output_file, output_format):
+    if output_format == "asm":
+        return open(output_file, 'w')
+    return nullcontext(HackEmitter())
+
+
+def close_output(output, output_file, output_format):
+    if output_format != "asm":
+        output.save(output_file, packed=output_format == "rom")
+
+
+def translate(input_file, output_file, comments=True, optimize=OPTIMIZE_NONE, verify=False, shared_routines=False,
+              output_format="asm", source_map=False):
+    """Reads the VM file and generates Hack assembly code.
+
+    optimize selects OPTIMIZE_PEEPHOLE or OPTIMIZE_FOLD; optimized output has no comments.
+    With verify the machine code of each straight-line block, folded and unfolded, is run
+    and checked against the reference VM interpreter first. shared_routines emits comparisons, call and
+    return once and jumps to them instead of inlining them at every use. output_format
+    "hack" or "rom" encodes the program directly instead of writing assembly. source_map
+    also writes a .map file locating each ROM address in the generated assembly and the
+    VM command it was generated for.
+    Returns the instruction counts before and after the peephole pass.
+    """
+    with open_output(output_file, output_format) as asm_file:
+        writer = CodeWriter(asm_file, comments, optimize=optimize >= OPTIMIZE_PEEPHOLE, shared_routines=shared_routines,
+                            source_map=source_map)
+
+        write_bootstrap(writer)
+        translate_file(input_file, writer, optimize, verify)
+
+        writer.finish()
+        close_output(asm_file, output_file, output_format)
+
+    if source_map:
+        save_source_map(writer, output_file)
+
+    return writer.instruction_counts()
+
+
+def translate_module(input_file, comments=True, optimize=OPTIMIZE_NONE, verify=False, shared_routines=False,
+                     source_map=False):
+    """Translates one file of a program in memory; runs in a worker process."""
+    asm_file = io.StringIO()
+    writer = CodeWriter(asm_file, comments, optimize=optimize >= OPTIMIZE_PEEPHOLE, shared_routines=shared_routines,
+                        source_map=source_map)
+
+    translate_file(input_file, writer, optimize, verify)
+    writer.flush()
+
+    return asm_file.getvalue(), writer.used_routines, writer.instruction_counts(), writer.source_map
+
+
+def translate_directory(directory, output_file=None, comments=True, optimize=OPTIMIZE_NONE, verify=False,
+                        shared_routines=False, jobs=None, output_format="asm", source_map=False):
+    """Translates every .vm file in a directory into one .asm file.
+
+    Files are translated concurrently and merged in sorted file order, after a bootstrap
+    that calls Sys.init when the program has a Sys.vm. Returns the output path and the
+    instruction counts of each file.
+    """
+    directory = directory.rstrip(os.sep)
+    vm_files = sorted(glob.glob(os.path.join(directory, "*.vm")))
+
+    if not vm_files:
+        raise ValueError(f"No .vm files in {directory}")
+
+    if output_file is None:
+        output_file = os.path.join(directory, os.path.basename(os.path.abspath(directory)) + "." + output_format)
+
+    count = len(vm_files)
+    options = ([comments] * count, [optimize] * count, [verify] * count, [shared_routines] * count, [source_map] * count)
+
+    if count == 1 or jobs == 1:
+        results = list(map(translate_module, vm_files, *options))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(translate_module, vm_files, *options))
+
+    with open_output(output_file, output_format) as asm_file:
+        writer = CodeWriter(asm_file, comments, optimize=optimize >= OPTIMIZE_PEEPHOLE, shared_routines=shared_routines,
+                            source_map=source_map)
+        write_bootstrap(writer, call_sys_init=any(module_name(path) == "Sys" for path in vm_files))
+        writer.flush()
+
+        for code, used_routines, _, module_map in results:
+            writer.write_module(code, module_map)
+            writer.used_routines |= used_routines
+
+        writer.finish()
+        close_output(asm_file, output_file, output_format)
+
+    if source_map:
+        save_source_map(writer, output_file)
+
+    file_counts = {path: counts for path, (_, _, counts, _) in zip(vm_files, results)}
+    return output_file, file_counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate VM code into Hack assembly.")
+    parser.add_argument('path', nargs='?', default="main.vm", help=".vm file or directory of .vm files")
+    parser.add_argument('-o', '--output', help="output .asm path")
+    parser.add_argument('-O', '--optimize', type=int, default=OPTIMIZE_NONE, choices=[OPTIMIZE_NONE, OPTIMIZE_PEEPHOLE, OPTIMIZE_FOLD],
+                        help="0: none, 1: peephole, 2: peephole and constant folding")
+    parser.add_argument('--verify', action='store_true', help="run the generated code of each block against the reference interpreter")
+    parser.add_argument('--shared', action='store_true', help="use shared comparison, call and return routines")
+    parser.add_argument('--no-comments', action='store_true', help="leave VM commands out of the output")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes in directory mode")
+    parser.add_argument('-f', '--format', default="asm", choices=OUTPUT_FORMATS,
+                        help="asm text, or machine code as .hack text or a packed .rom image")
+    parser.add_argument('--source-map', action='store_true', help="also write a .map file from ROM addresses to VM commands")
+    args = parser.parse_args(argv)
+
+    options = dict(comments=not args.no_comments, optimize=args.optimize, verify=args.verify, shared_routines=args.shared,
+                   output_format=args.format, source_map=args.source_map)
+
+    if os.path.isdir(args.path):
+        output_file, file_counts = translate_directory(args.path, args.output, jobs=args.jobs, **options)
+    else:
+        output_file = args.output or os.path.splitext(args.path)[0] + "." + args.format
+        file_counts = {args.path: translate(args.path, output_file, **options)}
+
+    for input_file, (before, after) in file_counts.items():
+        print(f"{input_file}: {before} -> {after} instructions ({before - after} saved)")
+
+    print(f"Output written to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
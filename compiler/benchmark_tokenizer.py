@@ -0,0 +1,177 @@
+import sys
+import time
+
+from tokenizer import KEYWORDS, SYMBOLS, JackTokenizer
+
+# A representative Jack class, repeated to reach Jack OS plus application size
+SAMPLE_CLASS = """
+/** Draws and moves a square on the screen. */
+class Square{index} {{
+    field int x, y; // screen location of the top-left corner
+    field int size;
+    static boolean visible;
+
+    constructor Square{index} new(int ax, int ay, int asize) {{
+        let x = ax;
+        let y = ay;
+        let size = asize;
+        do draw();
+        return this;
+    }}
+
+    /* Moves the square up by 2 pixels,
+       erasing the old bottom edge first. */
+    method void moveUp() {{
+        var int i;
+        if ((y > 1) & ~(size < 0)) {{
+            do Screen.setColor(false);
+            do Screen.drawRectangle(x, (y + size) - 1, x + size, y + size);
+            let y = y - 2;
+            let i = 0;
+            while (i < 10) {{
+                let i = i + 1;
+            }}
+            do Output.printString("moved up");
+        }}
+        return;
+    }}
+}}
+"""
+
+
+class CharacterScanner:
+    """The original character-at-a-time tokenizer, kept as the baseline to measure against."""
+
+    def __init__(self, source_code):
+        self.source_code = source_code
+        self.tokens = []  # Formatted strings, as Token's repr prints them
+        self.current_pos = 0
+
+    def tokenize(self):
+        while self.current_pos < len(self.source_code):
+            char = self.source_code[self.current_pos]
+
+            if char in " \t\n\r":
+                self.current_pos += 1
+                continue
+
+            if char == '/' and self.peek(1) == "/":
+                self.skip_single_line_comment()
+                continue
+
+            if char == '/' and self.peek(1) == "*":
+                self.skip_multi_line_comment()
+                continue
+
+            if char.isalpha() or char == "_":
+                self.tokens.append(self.consume_identifier())
+                continue
+
+            if char.isdigit():
+                self.tokens.append(self.consume_integer())
+                continue
+
+            if char == "\"":
+                self.tokens.append(self.consume_string())
+                continue
+
+            if char in SYMBOLS:
+                self.tokens.append(self.consume_symbol())
+                continue
+
+            # If we encounter an unknown character
+            raise ValueError(f"Unexpected character: {char}")
+
+    def skip_single_line_comment(self):
+        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos] != '\n':
+            self.current_pos += 1
+
+    def skip_multi_line_comment(self):
+        self.current_pos += 2
+        while self.current_pos < len(self.source_code):
+            if self.source_code[self.current_pos] == "*" and self.peek(1) == "/":
+                self.current_pos += 2
+                break
+            self.current_pos += 1
+
+    def consume_identifier(self):
+        start_pos = self.current_pos
+
+        while self.current_pos < len(self.source_code) and (self.source_code[self.current_pos].isalnum() or self.source_code[self.current_pos] == "_"):
+            self.current_pos += 1
+
+        identifier = self.source_code[start_pos:self.current_pos]
+
+        if identifier in KEYWORDS:
+            return f"KEYWORD: {identifier}"
+
+        return f"IDENTIFIER: {identifier}"
+
+    def consume_integer(self):
+        start_pos = self.current_pos
+
+        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos].isdigit():
+            self.current_pos += 1
+
+        return f"NUMBER: {self.source_code[start_pos:self.current_pos]}"
+
+    def consume_string(self):
+        self.current_pos += 1  # Skip the opening quote
+        start_pos = self.current_pos
+
+        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos] != "\"":
+            self.current_pos += 1
+
+        string = self.source_code[start_pos:self.current_pos]
+        self.current_pos += 1  # Skip the closing quote
+
+        return f"STRING: \"{string}\""
+
+    def consume_symbol(self):
+        symbol = self.source_code[self.current_pos]
+        self.current_pos += 1
+        return f"SYMBOL: {symbol}"
+
+    def peek(self, n):
+        if self.current_pos + n < len(self.source_code):
+            return self.source_code[self.current_pos + n]
+        return None
+
+
+def time_scanner(scan, source, repeats):
+    best = None
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scan(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def scan_by_character(source):
+    scanner = CharacterScanner(source)
+    scanner.tokenize()
+    return scanner.tokens
+
+
+def main(classes=200, repeats=3):
+    source = "".join(SAMPLE_CLASS.format(index=index) for index in range(classes))
+
+    if [str(token) for token in JackTokenizer(source).get_tokens()] != scan_by_character(source):
+        raise ValueError("Regex scanner and character scanner disagree")
+
+    token_count = len(JackTokenizer(source).values)
+    print(f"{classes} classes, {len(source)} characters, {token_count} tokens")
+
+    regex_time = time_scanner(JackTokenizer, source, repeats)
+    character_time = time_scanner(scan_by_character, source, repeats)
+
+    print(f"regex scanner:     {regex_time * 1000:.1f} ms")
+    print(f"character scanner: {character_time * 1000:.1f} ms")
+    print(f"speedup:           {character_time / regex_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
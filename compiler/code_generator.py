@@ -0,0 +1,305 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from parser import (ArrayAccess, BinaryOp, DoStatement, IfStatement, IntegerConstant, KeywordConstant, LetStatement,
+                    ReturnStatement, StringConstant, SubroutineCall, UnaryOp, VarRef, WhileStatement, parse)
+
+# VM segment for each kind of variable
+KIND_SEGMENTS = {
+    "static": "static",
+    "field": "this",
+    "argument": "argument",
+    "var": "local"
+}
+
+OPERATOR_COMMANDS = {
+    '+': "add",
+    '-': "sub",
+    '&': "and",
+    '|': "or",
+    '<': "lt",
+    '>': "gt",
+    '=': "eq",
+    '*': "call Math.multiply 2",
+    '/': "call Math.divide 2"
+}
+
+UNARY_COMMANDS = {
+    '-': "neg",
+    '~': "not"
+}
+
+
+class SymbolTable:
+    """Class-scope and subroutine-scope variables, each with a kind, type and index."""
+
+    def __init__(self):
+        self.class_scope = {}
+        self.subroutine_scope = {}
+        self.counts = dict.fromkeys(KIND_SEGMENTS, 0)
+
+    def start_subroutine(self):
+        self.subroutine_scope = {}
+        self.counts["argument"] = 0
+        self.counts["var"] = 0
+
+    def define(self, name, var_type, kind):
+        scope = self.class_scope if kind in ("static", "field") else self.subroutine_scope
+
+        if name in scope:
+            raise ValueError(f"Variable '{name}' is already defined")
+
+        scope[name] = (kind, var_type, self.counts[kind])
+        self.counts[kind] += 1
+
+    def lookup(self, name):
+        """Returns (kind, type, index) for a variable, or None for a class or subroutine name."""
+        return self.subroutine_scope.get(name) or self.class_scope.get(name)
+
+
+class CodeGenerator:
+    """Walks the AST of one class and writes its VM code."""
+
+    def __init__(self):
+        self.lines = []
+        self.symbols = SymbolTable()
+        self.class_name = None
+        self.label_count = 0
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def unique_label(self, prefix):
+        self.label_count += 1
+        return f"{prefix}{self.label_count}"
+
+    def variable(self, name):
+        entry = self.symbols.lookup(name)
+
+        if entry is None:
+            raise ValueError(f"Undefined variable '{name}' in class {self.class_name}")
+
+        kind, _, index = entry
+        return f"{KIND_SEGMENTS[kind]} {index}"
+
+    # Program structure
+
+    def compile_class(self, node):
+        self.class_name = node.name
+
+        for declaration in node.class_vars:
+            for name in declaration.names:
+                self.symbols.define(name, declaration.type, declaration.kind)
+
+        for subroutine in node.subroutines:
+            self.compile_subroutine(subroutine)
+
+        return self.lines
+
+    def compile_subroutine(self, node):
+        self.symbols.start_subroutine()
+        self.label_count = 0
+
+        if node.kind == "method":
+            self.symbols.define("this", self.class_name, "argument")
+
+        for parameter in node.parameters:
+            self.symbols.define(parameter.name, parameter.type, "argument")
+
+        local_count = 0
+        for declaration in node.locals:
+            for name in declaration.names:
+                self.symbols.define(name, declaration.type, "var")
+                local_count += 1
+
+        self.write(f"function {self.class_name}.{node.name} {local_count}")
+
+        if node.kind == "constructor":
+            self.write(f"push constant {self.symbols.counts['field']}")
+            self.write("call Memory.alloc 1")
+            self.write("pop pointer 0")
+        elif node.kind == "method":
+            self.write("push argument 0")
+            self.write("pop pointer 0")
+
+        self.compile_statements(node.statements)
+
+    # Statements
+
+    def compile_statements(self, statements):
+        for statement in statements:
+            if isinstance(statement, LetStatement):
+                self.compile_let(statement)
+            elif isinstance(statement, IfStatement):
+                self.compile_if(statement)
+            elif isinstance(statement, WhileStatement):
+                self.compile_while(statement)
+            elif isinstance(statement, DoStatement):
+                self.compile_call(statement.call)
+                self.write("pop temp 0")  # Discard the return value
+            elif isinstance(statement, ReturnStatement):
+                if statement.value is None:
+                    self.write("push constant 0")
+                else:
+                    self.compile_expression(statement.value)
+                self.write("return")
+
+    def compile_let(self, node):
+        if node.index is None:
+            self.compile_expression(node.value)
+            self.write(f"pop {self.variable(node.name)}")
+            return
+
+        # Address first, value second; the value may itself use 'that'
+        self.write(f"push {self.variable(node.name)}")
+        self.compile_expression(node.index)
+        self.write("add")
+        self.compile_expression(node.value)
+        self.write("pop temp 0")
+        self.write("pop pointer 1")
+        self.write("push temp 0")
+        self.write("pop that 0")
+
+    def compile_if(self, node):
+        else_label = self.unique_label("IF_ELSE")
+
+        self.compile_expression(node.condition)
+        self.write("not")
+        self.write(f"if-goto {else_label}")
+        self.compile_statements(node.statements)
+
+        if node.else_statements is None:
+            self.write(f"label {else_label}")
+            return
+
+        end_label = self.unique_label("IF_END")
+        self.write(f"goto {end_label}")
+        self.write(f"label {else_label}")
+        self.compile_statements(node.else_statements)
+        self.write(f"label {end_label}")
+
+    def compile_while(self, node):
+        loop_label = self.unique_label("WHILE_EXP")
+        end_label = self.unique_label("WHILE_END")
+
+        self.write(f"label {loop_label}")
+        self.compile_expression(node.condition)
+        self.write("not")
+        self.write(f"if-goto {end_label}")
+        self.compile_statements(node.statements)
+        self.write(f"goto {loop_label}")
+        self.write(f"label {end_label}")
+
+    # Expressions
+
+    def compile_expression(self, node):
+        if isinstance(node, BinaryOp):
+            self.compile_expression(node.left)
+            self.compile_expression(node.right)
+            self.write(OPERATOR_COMMANDS[node.op])
+        elif isinstance(node, UnaryOp):
+            self.compile_expression(node.operand)
+            self.write(UNARY_COMMANDS[node.op])
+        elif isinstance(node, IntegerConstant):
+            self.write(f"push constant {node.value}")
+        elif isinstance(node, StringConstant):
+            self.write(f"push constant {len(node.value)}")
+            self.write("call String.new 1")
+            for char in node.value:
+                self.write(f"push constant {ord(char)}")
+                self.write("call String.appendChar 2")
+        elif isinstance(node, KeywordConstant):
+            if node.value == "this":
+                self.write("push pointer 0")
+            else:
+                self.write("push constant 0")
+                if node.value == "true":
+                    self.write("not")
+        elif isinstance(node, VarRef):
+            self.write(f"push {self.variable(node.name)}")
+        elif isinstance(node, ArrayAccess):
+            self.write(f"push {self.variable(node.name)}")
+            self.compile_expression(node.index)
+            self.write("add")
+            self.write("pop pointer 1")
+            self.write("push that 0")
+        elif isinstance(node, SubroutineCall):
+            self.compile_call(node)
+
+    def compile_call(self, node):
+        argument_count = len(node.arguments)
+
+        if node.receiver is None:
+            # A method of this class, called on the current object
+            self.write("push pointer 0")
+            function_name = f"{self.class_name}.{node.name}"
+            argument_count += 1
+        elif self.symbols.lookup(node.receiver) is not None:
+            # A method called on an object held in a variable
+            _, var_type, _ = self.symbols.lookup(node.receiver)
+            self.write(f"push {self.variable(node.receiver)}")
+            function_name = f"{var_type}.{node.name}"
+            argument_count += 1
+        else:
+            # A function or constructor of another class
+            function_name = f"{node.receiver}.{node.name}"
+
+        for argument in node.arguments:
+            self.compile_expression(argument)
+
+        self.write(f"call {function_name} {argument_count}")
+
+
+def compile_source(source_code):
+    """Compiles the source of one Jack class and returns its VM code."""
+    lines = CodeGenerator().compile_class(parse(source_code))
+    return "\n".join(lines) + "\n"
+
+
+def compile_file(jack_file, vm_file=None):
+    """Compiles one .jack file into a .vm file next to it; runs in a worker process."""
+    if vm_file is None:
+        vm_file = os.path.splitext(jack_file)[0] + ".vm"
+
+    with open(jack_file, 'r') as source:
+        vm_code = compile_source(source.read())
+
+    with open(vm_file, 'w') as output:
+        output.write(vm_code)
+
+    return vm_file
+
+
+def compile_directory(directory, jobs=None):
+    """Compiles every .jack file in a directory; classes are independent, so each gets a worker."""
+    jack_files = sorted(glob.glob(os.path.join(directory, "*.jack")))
+
+    if not jack_files:
+        raise ValueError(f"No .jack files in {directory}")
+
+    if len(jack_files) == 1 or jobs == 1:
+        return [compile_file(path) for path in jack_files]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(compile_file, jack_files))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile Jack classes into VM code.")
+    parser.add_argument('path', help=".jack file or directory of .jack files")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes in directory mode")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.path):
+        vm_files = compile_directory(args.path, args.jobs)
+    else:
+        vm_files = [compile_file(args.path)]
+
+    for vm_file in vm_files:
+        print(f"VM code written to {vm_file}")
+
+
+if __name__ == "__main__":
+    main()
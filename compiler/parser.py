@@ -0,0 +1,550 @@
+import sys
+from bisect import bisect_left
+
+from tokenizer import IDENTIFIER, INT_CONST, KEYWORD, STRING_CONST, SYMBOL, JackTokenizer, LazyJackTokenizer
+
+OPERATORS = {'+', '-', '*', '/', '&', '|', '<', '>', '='}
+UNARY_OPERATORS = {'-', '~'}
+KEYWORD_CONSTANTS = {'true', 'false', 'null', 'this'}
+PRIMITIVE_TYPES = {'int', 'char', 'boolean'}
+
+
+# AST nodes. Slotted and positional so a large program parses into compact objects.
+# offset is the source offset of the node's first token. Inside a subroutine it is relative
+# to the subroutine's offset, so an unchanged subroutine can be moved by an edit as a unit.
+
+class Node:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Class(Node):
+    __slots__ = ("name", "class_vars", "subroutines", "offset")
+
+
+class ClassVarDec(Node):
+    __slots__ = ("kind", "type", "names", "offset")  # kind is 'static' or 'field'
+
+
+class SubroutineDec(Node):
+    # end is the offset just past the closing brace
+    __slots__ = ("kind", "return_type", "name", "parameters", "locals", "statements", "offset", "end")
+
+
+class Parameter(Node):
+    __slots__ = ("type", "name")
+
+
+class VarDec(Node):
+    __slots__ = ("type", "names", "offset")
+
+
+class LetStatement(Node):
+    __slots__ = ("name", "index", "value", "offset")  # index is None unless assigning to name[index]
+
+
+class IfStatement(Node):
+    __slots__ = ("condition", "statements", "else_statements", "offset")  # else_statements may be None
+
+
+class WhileStatement(Node):
+    __slots__ = ("condition", "statements", "offset")
+
+
+class DoStatement(Node):
+    __slots__ = ("call", "offset")
+
+
+class ReturnStatement(Node):
+    __slots__ = ("value", "offset")  # value is None for a bare return
+
+
+class BinaryOp(Node):
+    __slots__ = ("op", "left", "right")
+
+
+class UnaryOp(Node):
+    __slots__ = ("op", "operand")
+
+
+class IntegerConstant(Node):
+    __slots__ = ("value",)
+
+
+class StringConstant(Node):
+    __slots__ = ("value",)
+
+
+class KeywordConstant(Node):
+    __slots__ = ("value",)
+
+
+class VarRef(Node):
+    __slots__ = ("name",)
+
+
+class ArrayAccess(Node):
+    __slots__ = ("name", "index")
+
+
+class SubroutineCall(Node):
+    __slots__ = ("receiver", "name", "arguments")  # receiver is a class or variable name, or None
+
+
+class JackParser:
+    """Recursive-descent parser for the full Jack grammar, building an AST of slotted nodes."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.base_offset = 0  # Offset of the subroutine being parsed
+
+    # Token helpers
+
+    def error(self, expected):
+        position = self.tokenizer.token_position()
+        found = self.tokenizer.token_value()
+
+        if position is None:
+            raise ValueError(f"Expected {expected}, reached the end of the source")
+
+        line, column = position
+        raise ValueError(f"Expected {expected} at line {line}, column {column}, got '{found}'")
+
+    def at(self, *values):
+        """True when the current token is one of these keywords or symbols."""
+        token_type = self.tokenizer.token_type()
+        return (token_type == SYMBOL or token_type == KEYWORD) and self.tokenizer.token_value() in values
+
+    def expect(self, value):
+        if not self.at(value):
+            self.error(f"'{value}'")
+        self.tokenizer.advance()
+
+    def expect_identifier(self, what="identifier"):
+        if self.tokenizer.token_type() != IDENTIFIER:
+            self.error(what)
+
+        name = self.tokenizer.token_value()
+        self.tokenizer.advance()
+        return name
+
+    def expect_type(self, allow_void=False):
+        value = self.tokenizer.token_value()
+
+        if self.tokenizer.token_type() == IDENTIFIER or self.at(*PRIMITIVE_TYPES) or (allow_void and self.at('void')):
+            self.tokenizer.advance()
+            return value
+
+        self.error("a type")
+
+    # Program structure
+
+    def compile_class(self):
+        offset = self.tokenizer.token_offset()
+        self.expect('class')
+        name = self.expect_identifier("class name")
+        self.expect('{')
+
+        class_vars = []
+        while self.at('static', 'field'):
+            class_vars.append(self.compile_class_var_dec())
+
+        subroutines = []
+        while self.at('constructor', 'function', 'method'):
+            subroutines.append(self.compile_subroutine_dec())
+
+        self.expect('}')
+
+        if self.tokenizer.token_type() is not None:
+            self.error("end of file after the class")
+
+        return Class(name, class_vars, subroutines, offset)
+
+    def compile_class_var_dec(self):
+        offset = self.tokenizer.token_offset()
+        kind = self.tokenizer.token_value()
+        self.tokenizer.advance()  # 'static' or 'field'
+
+        var_type = self.expect_type()
+        names = self.compile_var_names()
+
+        return ClassVarDec(kind, var_type, names, offset)
+
+    def compile_var_names(self):
+        names = [self.expect_identifier("variable name")]
+
+        while self.at(','):
+            self.tokenizer.advance()
+            names.append(self.expect_identifier("variable name"))
+
+        self.expect(';')
+        return names
+
+    def compile_subroutine_dec(self):
+        offset = self.tokenizer.token_offset()
+        kind = self.tokenizer.token_value()
+        self.tokenizer.advance()  # 'constructor', 'function' or 'method'
+        self.base_offset = offset
+
+        return_type = self.expect_type(allow_void=True)
+        name = self.expect_identifier("subroutine name")
+
+        self.expect('(')
+        parameters = self.compile_parameter_list()
+        self.expect(')')
+
+        self.expect('{')
+
+        local_vars = []
+        while self.at('var'):
+            local_vars.append(self.compile_var_dec())
+
+        statements = self.compile_statements()
+
+        end = self.tokenizer.token_offset()
+        self.expect('}')
+        self.base_offset = 0
+
+        return SubroutineDec(kind, return_type, name, parameters, local_vars, statements, offset, end + 1)
+
+    def compile_parameter_list(self):
+        parameters = []
+
+        if self.at(')'):
+            return parameters
+
+        parameters.append(Parameter(self.expect_type(), self.expect_identifier("parameter name")))
+
+        while self.at(','):
+            self.tokenizer.advance()
+            parameters.append(Parameter(self.expect_type(), self.expect_identifier("parameter name")))
+
+        return parameters
+
+    def compile_var_dec(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.expect('var')
+
+        var_type = self.expect_type()
+        names = self.compile_var_names()
+
+        return VarDec(var_type, names, offset)
+
+    # Statements
+
+    def compile_statements(self):
+        statements = []
+
+        while True:
+            if self.at('let'):
+                statements.append(self.compile_let_statement())
+            elif self.at('if'):
+                statements.append(self.compile_if_statement())
+            elif self.at('while'):
+                statements.append(self.compile_while_statement())
+            elif self.at('do'):
+                statements.append(self.compile_do_statement())
+            elif self.at('return'):
+                statements.append(self.compile_return_statement())
+            else:
+                return statements
+
+    def compile_block(self):
+        self.expect('{')
+        statements = self.compile_statements()
+        self.expect('}')
+        return statements
+
+    def compile_let_statement(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.tokenizer.advance()  # 'let'
+
+        name = self.expect_identifier("variable name")
+
+        index = None
+        if self.at('['):
+            self.tokenizer.advance()
+            index = self.compile_expression()
+            self.expect(']')
+
+        self.expect('=')
+        value = self.compile_expression()
+        self.expect(';')
+
+        return LetStatement(name, index, value, offset)
+
+    def compile_if_statement(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.tokenizer.advance()  # 'if'
+
+        self.expect('(')
+        condition = self.compile_expression()
+        self.expect(')')
+
+        statements = self.compile_block()
+
+        else_statements = None
+        if self.at('else'):
+            self.tokenizer.advance()
+            else_statements = self.compile_block()
+
+        return IfStatement(condition, statements, else_statements, offset)
+
+    def compile_while_statement(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.tokenizer.advance()  # 'while'
+
+        self.expect('(')
+        condition = self.compile_expression()
+        self.expect(')')
+
+        return WhileStatement(condition, self.compile_block(), offset)
+
+    def compile_do_statement(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.tokenizer.advance()  # 'do'
+
+        name = self.expect_identifier("subroutine name")
+        call = self.compile_subroutine_call(name)
+        self.expect(';')
+
+        return DoStatement(call, offset)
+
+    def compile_return_statement(self):
+        offset = self.tokenizer.token_offset() - self.base_offset
+        self.tokenizer.advance()  # 'return'
+
+        value = None
+        if not self.at(';'):
+            value = self.compile_expression()
+        self.expect(';')
+
+        return ReturnStatement(value, offset)
+
+    # Expressions
+
+    def compile_expression(self):
+        # Jack has no operator precedence: operators apply left to right
+        expression = self.compile_term()
+
+        while self.tokenizer.token_type() == SYMBOL and self.tokenizer.token_value() in OPERATORS:
+            op = self.tokenizer.token_value()
+            self.tokenizer.advance()
+            expression = BinaryOp(op, expression, self.compile_term())
+
+        return expression
+
+    def compile_term(self):
+        token_type = self.tokenizer.token_type()
+        value = self.tokenizer.token_value()
+
+        if token_type == INT_CONST:
+            self.tokenizer.advance()
+            return IntegerConstant(int(value))
+
+        if token_type == STRING_CONST:
+            self.tokenizer.advance()
+            return StringConstant(value)
+
+        if token_type == KEYWORD and value in KEYWORD_CONSTANTS:
+            self.tokenizer.advance()
+            return KeywordConstant(value)
+
+        if token_type == IDENTIFIER:
+            self.tokenizer.advance()
+
+            if self.at('['):
+                self.tokenizer.advance()
+                index = self.compile_expression()
+                self.expect(']')
+                return ArrayAccess(value, index)
+
+            if self.at('(', '.'):
+                return self.compile_subroutine_call(value)
+
+            return VarRef(value)
+
+        if token_type == SYMBOL and value == '(':
+            self.tokenizer.advance()
+            expression = self.compile_expression()
+            self.expect(')')
+            return expression
+
+        if token_type == SYMBOL and value in UNARY_OPERATORS:
+            self.tokenizer.advance()
+            return UnaryOp(value, self.compile_term())
+
+        self.error("an expression")
+
+    def compile_subroutine_call(self, name):
+        """Parses the rest of a call whose first name has already been consumed."""
+        receiver = None
+
+        if self.at('.'):
+            self.tokenizer.advance()
+            receiver = name
+            name = self.expect_identifier("subroutine name")
+
+        self.expect('(')
+        arguments = self.compile_expression_list()
+        self.expect(')')
+
+        return SubroutineCall(receiver, name, arguments)
+
+    def compile_expression_list(self):
+        expressions = []
+
+        if self.at(')'):
+            return expressions
+
+        expressions.append(self.compile_expression())
+
+        while self.at(','):
+            self.tokenizer.advance()
+            expressions.append(self.compile_expression())
+
+        return expressions
+
+
+def parse(source_code, lazy=False):
+    """Parses Jack source (a string, or a text stream when lazy) into a Class node."""
+    tokenizer = LazyJackTokenizer(source_code) if lazy else JackTokenizer(source_code)
+    return JackParser(tokenizer).compile_class()
+
+
+class IncrementalParser:
+    """Keeps the tokens and AST of a class being edited and updates both on each edit.
+
+    An edit inside one subroutine rescans only the tokens around it and reparses only that
+    subroutine; the other subroutines are reused, moved by the edit's length change. Edits
+    elsewhere, or that move a subroutine boundary, fall back to parsing the whole class.
+    """
+
+    def __init__(self, source_code):
+        self.tokenizer = JackTokenizer(source_code)
+        self.tree = None
+        self.tree = self.parse_all()
+
+    def parse_all(self):
+        self.tokenizer.token_pos = 0
+        return JackParser(self.tokenizer).compile_class()
+
+    def edit(self, start, end, text):
+        """Replaces source[start:end] with text and returns the updated Class node.
+
+        Raises ValueError for an edit that leaves a syntax error; the next edit then parses
+        the whole class again.
+        """
+        tree, self.tree = self.tree, None
+        self.tokenizer.edit(start, end, text)
+
+        subroutines = tree.subroutines if tree is not None else []
+        index = next((i for i, subroutine in enumerate(subroutines)
+                      if subroutine.offset < start and end <= subroutine.end), None)
+
+        if index is None:
+            self.tree = self.parse_all()
+            return self.tree
+
+        delta = len(text) - (end - start)
+        tokenizer = self.tokenizer
+        tokenizer.token_pos = bisect_left(tokenizer.offsets, subroutines[index].offset)
+        parser = JackParser(tokenizer)
+        in_step = parser.at('constructor', 'function', 'method')
+
+        if in_step:
+            subroutine = parser.compile_subroutine_dec()
+
+            # The reparse must stop where the next subroutine, or the class's closing brace, was
+            if index + 1 < len(subroutines):
+                in_step = tokenizer.token_offset() == subroutines[index + 1].offset + delta
+            else:
+                in_step = tokenizer.token_value() == '}' and tokenizer.token_pos == len(tokenizer.values) - 1
+
+        if not in_step:
+            self.tree = self.parse_all()
+            return self.tree
+
+        for moved in subroutines[index + 1:]:
+            moved.offset += delta  # Offsets inside a subroutine are relative, so they stay put
+            moved.end += delta
+
+        updated = subroutines[:index] + [subroutine] + subroutines[index + 1:]
+        self.tree = Class(tree.name, tree.class_vars, updated, tree.offset)
+        return self.tree
+
+
+def dump(node, indent=0):
+    """Returns an indented debug listing of an AST."""
+    pad = "  " * indent
+
+    if isinstance(node, list):
+        return "".join(dump(item, indent) for item in node)
+
+    if not isinstance(node, Node):
+        return f"{pad}{node!r}\n"
+
+    lines = [f"{pad}{type(node).__name__}\n"]
+
+    for name in node.__slots__:
+        value = getattr(node, name)
+
+        if isinstance(value, (Node, list)) and value:
+            lines.append(f"{pad}  {name}:\n")
+            lines.append(dump(value, indent + 2))
+        elif name not in ("offset", "end"):
+            lines.append(f"{pad}  {name}: {value!r}\n")
+
+    return "".join(lines)
+
+
+def to_xml(node, indent=0):
+    """Returns an XML rendering of an AST: one element per node, scalar fields as attributes."""
+    pad = "  " * indent
+    tag = type(node).__name__
+    attributes = []
+    children = []
+
+    for name in node.__slots__:
+        value = getattr(node, name)
+
+        if isinstance(value, Node):
+            children.append(f"{pad}  <{name}>\n{to_xml(value, indent + 2)}{pad}  </{name}>\n")
+        elif isinstance(value, list) and value and isinstance(value[0], Node):
+            items = "".join(to_xml(item, indent + 2) for item in value)
+            children.append(f"{pad}  <{name}>\n{items}{pad}  </{name}>\n")
+        elif value is not None and value != []:
+            text = ",".join(value) if isinstance(value, list) else str(value)
+            text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+            attributes.append(f' {name}="{text}"')
+
+    if not children:
+        return f"{pad}<{tag}{''.join(attributes)}/>\n"
+
+    return f"{pad}<{tag}{''.join(attributes)}>\n{''.join(children)}{pad}</{tag}>\n"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as source_file:
+            tree = parse(source_file, lazy=True)
+    else:
+        tree = parse("""
+        class Main {
+            function void main() {
+                var int x;
+                let x = 5;
+                do Output.printString("Hello, world!");
+                return;
+            }
+        }
+        """)
+
+    print(to_xml(tree), end="")
@@ -1,4 +1,11 @@
 import re
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import accumulate
+from operator import itemgetter, sub
 
 # Jack Keywords and Symbols
 KEYWORDS = {
@@ -12,363 +19,447 @@ SYMBOLS = {
     '|', '<', '>', '=', '~'
 }
 
-class JackTokenizer:
-    def __init__(self, source_code):
-        self.source_code = source_code
-        self.tokens = []
-        self.current_pos = 0
-        self.token_pos = 0    # For token position during parsing
-        self.tokenize()
-
-    def tokenize(self):
-        while self.current_pos < len(self.source_code):
-            char = self.source_code[self.current_pos]
-
-            if char in " \t\n\r":
-                self.current_pos += 1
-                continue
-
-            if char == '/' and self.peek(1) == "/":
-                self.skip_single_line_comment()
-                continue
-
-            if char == '/' and self.peek(1) == "*":
-                self.skip_multi_line_comment()
-                continue
-
-            if char.isalpha() or char == "_":
-                self.tokens.append(self.consume_identifier())
-                continue
-
-            if char.isdigit():
-                self.tokens.append(self.consume_integer())
-                continue
-
-            if char == "\"":
-                self.tokens.append(self.consume_string())
-                continue
-
-            if char in SYMBOLS:
-                self.tokens.append(self.consume_symbol())
-                continue
-
-            # If we encounter an unknown character
-            raise ValueError(f"Unexpected character: {char}")
-
-    def skip_single_line_comment(self):
-        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos] != '\n':
-            self.current_pos += 1
-
-    def skip_multi_line_comment(self):
-        self.current_pos += 2
-        while self.current_pos < len(self.source_code):
-            if self.source_code[self.current_pos] == "*" and self.peek(1) == "/":
-                self.current_pos += 2
-                break
-            self.current_pos += 1
-
-    def consume_identifier(self):
-        start_pos = self.current_pos
-
-        while self.current_pos < len(self.source_code) and (self.source_code[self.current_pos].isalnum() or self.source_code[self.current_pos] == "_"):
-            self.current_pos += 1
-
-        identifier = self.source_code[start_pos:self.current_pos]
-
-        if identifier in KEYWORDS:
-            return f"KEYWORD: {identifier}"
-
-        return f"IDENTIFIER: {identifier}"
+# Token type codes
+KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST = range(5)
+
+TOKEN_TYPE_NAMES = ("KEYWORD", "SYMBOL", "IDENTIFIER", "NUMBER", "STRING")
+
+# One master pattern: whitespace and comments are skipped inside the regex, and each match
+# captures one whole token. Any other character is captured alone and rejected later.
+# Unterminated comments and strings run to the end of the source, as in the old scanner.
+SKIP = r"[ \t\n\r]+|//[^\n]*|/\*.*?(?:\*/|\Z)"
+TOKEN = r"""
+    "[^"]*"?
+  | [^\W\d]\w*
+  | \d+
+  | [{}()\[\].,;+\-*/&|<>=~]
+  | .
+"""
+TOKEN_PATTERN = re.compile(rf"(?:{SKIP})*({TOKEN})?", re.VERBOSE | re.DOTALL)
+SKIP_PATTERN = re.compile(SKIP, re.DOTALL)
 
-    def consume_integer(self):
-        start_pos = self.current_pos
+# The same matches uncaptured: findall returns them whole, and since they tile the source
+# their lengths add up to the token offsets
+MATCH_PATTERN = re.compile(rf"(?:{SKIP})*(?:{TOKEN})?", re.VERBOSE | re.DOTALL)
 
-        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos].isdigit():
-            self.current_pos += 1
 
-        return f"NUMBER: {self.source_code[start_pos:self.current_pos]}"
+def classify_token(text):
+    """Returns the type code and interned value of a token, or None for an unknown character."""
+    if text[0] == '"':
+        string = text[1:-1] if len(text) > 1 and text.endswith('"') else text[1:]
+        return STRING_CONST, sys.intern(string)
 
-    def consume_string(self):
-        self.current_pos += 1  # Skip the opening quote
-        start_pos = self.current_pos
+    if text.isdigit():
+        return INT_CONST, sys.intern(text)
 
-        while self.current_pos < len(self.source_code) and self.source_code[self.current_pos] != "\"":
-            self.current_pos += 1
+    if text in SYMBOLS:
+        return SYMBOL, sys.intern(text)
 
-        string = self.source_code[start_pos:self.current_pos]
-        self.current_pos += 1  # Skip the closing quote
+    if text in KEYWORDS:
+        return KEYWORD, sys.intern(text)
 
-        return f"STRING: \"{string}\""
+    if text[0].isalpha() or text[0] == "_":
+        return IDENTIFIER, sys.intern(text)
 
-    def consume_symbol(self):
-        symbol = self.source_code[self.current_pos]
-        self.current_pos += 1
-        return f"SYMBOL: {symbol}"
+    return None
 
-    def peek(self, n):
-        if self.current_pos + n < len(self.source_code):
-            return self.source_code[self.current_pos + n]
-        return None
 
-    def get_tokens(self):
-        return self.tokens
+def classify_match(match):
+    """Classifies the token a whole match ends with as (type, value, length).
 
-    def current_token(self):
-        if self.token_pos < len(self.tokens):
+    Returns None when the match holds only whitespace and comments, and a type of None for
+    an unknown character.
+    """
+    text = match.lstrip(" \t\n\r")
 
-            # print("token position", self.token_pos)
-            
-            # print("token", self.tokens[self.token_pos])
+    if text.startswith(("//", "/*")):
+        text = TOKEN_PATTERN.match(text).group(1)  # Comments before the token
 
-            return self.tokens[self.token_pos]
+    if not text:
         return None
 
-    def advance(self):
-        if self.token_pos + 1 < len(self.tokens):
-            self.token_pos += 1
-        else:
-            raise ValueError("No more tokens.")
-
-
-class JackParser:
-    def __init__(self, tokenizer):
-        self.tokenizer = tokenizer
-        self.output = []
-
-    def compile_class(self):
-        print("class", self.tokenizer.current_token()) # Print the class keyword
-
-        self.tokenizer.advance() # 'class' keyword
-        
-        print("class name", self.tokenizer.current_token()) # Print class name
-
-        self.tokenizer.advance() # class name
-
-        print("{")
-
-        self.tokenizer.advance() # '{'
-
-        self.compile_class_var_dec() # Handle class variable declarations
-
-        print("}")  # Print the closing brace
-        
-        self.tokenizer.advance()  # '}'
-
-
-    def compile_class_var_dec(self):
-        while self.tokenizer.current_token() in ["static", "field"]:
-            print("class_var_dec")
-
-            self.tokenizer.advance() # 'static' or 'field'
-
-            print("var type", self.tokenizer.current_token())
-
-            self.tokenizer.advance() # type
-
-            print("var name", self.tokenizer.current_token())
-
-            self.tokenizer.advance()  # variable name
+    token = classify_token(text)
 
-            while self.tokenizer.current_token() == ",":
-                self.tokenizer.advance()
+    if token is None:
+        return None, text, len(text)
+    return token[0], token[1], len(text)
 
-                print("var name", self.tokenizer.current_token())  # Print additional variable names
 
-            print(";")
+class Token:
+    """One token: a type code, its interned value and its offset in the source."""
 
-            self.tokenizer.advance()
+    __slots__ = ("type", "value", "offset")
 
-    def compile_subroutine_dec(self):
-        while self.tokenizer.current_token() in ['constructor', 'function', 'method']:
-            print("subroutine_dec")
+    def __init__(self, type, value, offset):
+        self.type = type
+        self.value = value
+        self.offset = offset
 
-            self.tokenizer.advance()
+    def __repr__(self):
+        if self.type == STRING_CONST:
+            return f"STRING: \"{self.value}\""
+        return f"{TOKEN_TYPE_NAMES[self.type]}: {self.value}"
 
-            print("return type", self.tokenizer.current_token())
 
-            self.tokenizer.advance()
+CHUNK_SIZE = 1 << 16  # Characters read from a stream at a time
 
-            print("subroutine name", self.tokenizer.current_token())
 
-            self.tokenizer.advance()
+def iter_tokens(source, chunk_size=CHUNK_SIZE):
+    """Scans a string or text stream lazily, yielding (type, value, offset, line, column).
 
-            print("(")
+    Only the unscanned tail of the current chunk is buffered. A match that reaches the end
+    of the buffer may continue in the next chunk, so it is rescanned once more text arrives;
+    a comment or string left open is only searched for its end until that end arrives.
+    """
+    if isinstance(source, str):
+        chunks = iter([source])
+    else:
+        chunks = iter(lambda: source.read(chunk_size), '')
 
-            self.tokenizer.advance()
+    seen = {}  # Keywords, symbols and identifiers; literals are classified every time
+    buffer = ''
+    base = 0  # Source offset of buffer[0]
+    line = 1
+    line_start = 0  # Source offset of the current line
+    at_end = False
+    terminator = None  # Ends the comment or string open at buffer[0]
+    search_from = 0
 
-            self.compile_parameter_list()
+    while not at_end:
+        chunk = next(chunks, None)
 
-    def compile_parameter_list(self):
-        print("parameter_list")
-
-        if self.tokenizer.current_token() != ')':
-            print("param type", self.tokenizer.current_token())
-
-            self.tokenizer.advance()
-
-            print("param name", self.tokenizer.current_token())
-
-            self.tokenizer.advance()
-
-            while self.tokenizer.current_token() == ",":
-                self.tokenizer.advance()
-
-                print("param type", self.tokenizer.current_token())
-
-                self.tokenizer.advance()
-
-                print("param name", self.tokenizer.current_token())
-
-                self.tokenizer.advance()
-
-
-    def compile_var_dec(self):
-        while self.tokenizer.current_token == "var":
-            print("var_dec")
-
-            self.tokenizer.advance()
-
-            print("var type", self.tokenizer.current_token())
-
-            self.tokenizer.advance()
-
-            print("var name", self.tokenizer.current_token())
+        if chunk is None:
+            at_end = True
+        else:
+            buffer += chunk
+
+            if terminator:
+                if buffer.find(terminator, search_from) < 0:
+                    search_from = len(buffer) - len(terminator) + 1
+                    continue
+                terminator = None
+
+        scanned = 0
+        counted = 0  # Buffer index up to which newlines are counted into line
+
+        for match in TOKEN_PATTERN.finditer(buffer):
+            text = match.group(1)
+
+            if match.end() == len(buffer) and not at_end:
+                # May continue in the next chunk; keep only the unfinished token or comment
+                if text is not None:
+                    scanned = match.start(1)
+                    if text[0] == '"' and (len(text) == 1 or text[-1] != '"'):
+                        terminator, search_from = '"', len(buffer)
+                else:
+                    pending = ''
+                    scanned = match.start()
+                    for skipped in SKIP_PATTERN.finditer(buffer, scanned):
+                        scanned, pending = skipped.start(), skipped.group()
+
+                    if pending.startswith('//'):
+                        terminator, search_from = '\n', len(buffer)
+                    elif pending.startswith('/*') and not (len(pending) >= 4 and pending.endswith('*/')):
+                        terminator, search_from = '*/', max(len(buffer) - 1, scanned + 2)
+                break
 
-            self.tokenizer.advance()
+            scanned = match.end()
 
-            while self.tokenizer.current_token() == ',':
-                self.tokenizer.advance()
+            if text is None:
+                continue  # Trailing whitespace or comments
 
-                print("var name", self.tokenizer.current_token())
+            start = match.start(1)
+            line += buffer.count('\n', counted, start)
+            counted = start
+            newline = buffer.rfind('\n', 0, start)
+            column = start - newline if newline >= 0 else base + start - line_start + 1
 
-                self.tokenizer.advance()
+            token = seen.get(text)
 
-            print(';')
+            if token is None:
+                token = classify_token(text)
 
-            self.tokenizer.advance()
+                if token is None:
+                    # If we encounter an unknown character
+                    raise ValueError(f"Unexpected character: {text} at line {line}, column {column}")
 
-    def compile_statements(self):
-        while self.tokenizer.current_token() in ['let', 'if', 'while', 'do', 'return']:
-            if self.tokenizer.current_token() == 'let':
-                self.compile_let_statement()
-            elif self.tokenizer.current_token() == 'if':
-                self.compile_if_statement()
-            elif self.tokenizer.current_token() == 'while':
-                self.compile_while_statement()
-            elif self.tokenizer.current_token() == 'do':
-                self.compile_do_statement()
-            elif self.tokenizer.current_token() == 'return':
-                self.compile_return_statement()
+                if token[0] != STRING_CONST and token[0] != INT_CONST:
+                    seen[text] = token
 
+            yield token[0], token[1], base + start, line, column
 
-    def compile_let_statement(self):
-        print("let_statement")
+        line += buffer.count('\n', counted, scanned)
+        newline = buffer.rfind('\n', 0, scanned)
+        if newline >= 0:
+            line_start = base + newline + 1
 
-        self.tokenizer.advance()
+        buffer = buffer[scanned:]
+        base += scanned
+        search_from -= scanned
 
-        print("var name", self.tokenizer.current_token())
 
-        self.tokenizer.advance()
+class TokenCursor(ABC):
+    """The token interface the parser reads through, shared by the eager and lazy tokenizers.
 
-        print("=")  # Print assignment operator
+    Each accessor returns None once the tokens are used up.
+    """
 
-        self.tokenizer.advance()
+    def current_token(self):
+        if self.token_type() is None:
+            return None
+        return Token(self.token_type(), self.token_value(), self.token_offset())
 
-        print("value or expression", self.tokenizer.current_token())
+    @abstractmethod
+    def token_type(self):
+        pass
 
-        self.tokenizer.advance()
+    @abstractmethod
+    def token_value(self):
+        pass
 
-        print(";")  # Print semicolon
-        
-        self.tokenizer.advance()
+    @abstractmethod
+    def token_offset(self):
+        pass
 
-    def compile_if_statement(self):
-        print("if_statement")
+    @abstractmethod
+    def peek_value(self, n=1):
+        pass
 
-        self.tokenizer.advance()
+    @abstractmethod
+    def token_position(self):
+        pass
 
-        print("condition", self.tokenizer.current_token())
+    @abstractmethod
+    def advance(self):
+        pass
 
-        self.tokenizer.advance()
+    @abstractmethod
+    def get_tokens(self):
+        pass
 
-        print("if block", self.tokenizer.current_token())
 
-        self.tokenizer.advance()
+class JackTokenizer(TokenCursor):
+    def __init__(self, source_code):
+        if not isinstance(source_code, str):
+            source_code = source_code.read()  # A file or pipe, read whole
 
-        self.compile_statements()
+        self.source_code = source_code
+        # Tokens are kept as parallel arrays rather than one object each
+        self.types = array('B')
+        self.values = []
+        self.offsets = array('I')
+        self.line_starts = None
+        self.stale = False  # Set when an edit left a character the tokens could not cover
+        self.token_pos = 0    # For token position during parsing
+        self.tokenize()
 
-        if self.tokenizer.current_token() == 'else':
-            print("else")
+    def tokenize(self):
+        """Scans the whole source into the token arrays.
 
-            self.tokenizer.advance()
+        findall matches without a match object per token. Each distinct match is classified
+        once, and the offsets come from the running total of the match lengths.
+        """
+        matches = MATCH_PATTERN.findall(self.source_code)
+        seen = {match: classify_match(match) for match in set(matches)}  # Most matches repeat
+        tokens = list(map(seen.__getitem__, matches))
 
-            self.compile_statements()
+        while tokens and tokens[-1] is None:
+            tokens.pop()  # Trailing whitespace or comments
 
-    def compile_while_statement(self):
-        print("while_statement")
+        offsets = array('I', map(sub, accumulate(map(len, matches)), map(itemgetter(2), tokens)))
 
-        self.tokenizer.advance()  # while
+        if any(token is not None and token[0] is None for token in seen.values()):
+            index = next(index for index, token in enumerate(tokens) if token[0] is None)
+            # If we encounter an unknown character
+            line, column = self.position(offsets[index])
+            raise ValueError(f"Unexpected character: {tokens[index][1]} at line {line}, column {column}")
+
+        self.types.frombytes(bytes(map(itemgetter(0), tokens)))
+        self.values.extend(map(itemgetter(1), tokens))
+        self.offsets.extend(offsets)
+
+    def edit(self, start, end, text):
+        """Replaces source_code[start:end] with text and rescans only the region it touched.
+
+        Scanning restarts at the last token before the edit and stops at the first new token
+        past the edit that starts where an old token did: the text from there on is unchanged,
+        so the rest of the old tokens are kept and only their offsets move. Returns
+        (first, old_stop, new_stop): tokens[first:old_stop] were replaced by tokens[first:new_stop].
+        """
+        source = self.source_code[:start] + text + self.source_code[end:]
+        self.source_code = source
+        self.line_starts = None
+        self.token_pos = 0
+
+        if self.stale:
+            # The last edit was rejected part way, so the old tokens can't be trusted
+            old_stop = len(self.values)
+            del self.types[:], self.values[:], self.offsets[:]
+            self.tokenize()
+            self.stale = False
+            return 0, old_stop, len(self.values)
+
+        offsets = self.offsets
+        delta = len(text) - (end - start)
+        edit_end = start + len(text)  # End of the inserted text in the new source
+        first = max(bisect_left(offsets, start) - 1, 0)
+        restart = offsets[first] if first < len(offsets) and offsets[first] < start else 0
+        old_stop = len(offsets)
+        types, values, new_offsets = array('B'), [], array('I')
+
+        for match in TOKEN_PATTERN.finditer(source, restart):
+            token_text = match.group(1)
+
+            if token_text is None:
+                continue  # Trailing whitespace or comments
+
+            offset = match.start(1)
+
+            if offset >= edit_end:
+                old_index = bisect_left(offsets, offset - delta, first)
+                if old_index < len(offsets) and offsets[old_index] == offset - delta:
+                    old_stop = old_index  # Back in step with the old tokens
+                    break
+
+            token = classify_token(token_text)
+
+            if token is None:
+                self.stale = True
+                line, column = self.position(offset)
+                raise ValueError(f"Unexpected character: {token_text} at line {line}, column {column}")
+
+            types.append(token[0])
+            values.append(token[1])
+            new_offsets.append(offset)
+
+        tail = offsets[old_stop:]
+        if delta:
+            tail = array('I', map(delta.__add__, tail))  # The only step that grows with the file
+
+        self.types[first:old_stop] = types
+        self.values[first:old_stop] = values
+        self.offsets[first:] = new_offsets + tail
+
+        return first, old_stop, first + len(values)
+
+    def position(self, offset):
+        """Returns the 1-based line and column of a source offset."""
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in re.finditer("\n", self.source_code)]
+
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
 
-        print("condition", self.tokenizer.current_token())
+    def get_tokens(self):
+        return [Token(*token) for token in zip(self.types, self.values, self.offsets)]
 
-        self.tokenizer.advance()
+    def token_type(self):
+        if self.token_pos < len(self.types):
+            return self.types[self.token_pos]
+        return None
 
-        print("while block", self.tokenizer.current_token())
+    def token_value(self):
+        if self.token_pos < len(self.values):
+            return self.values[self.token_pos]
+        return None
 
-        self.tokenizer.advance()
+    def token_offset(self):
+        if self.token_pos < len(self.offsets):
+            return self.offsets[self.token_pos]
+        return None
 
-        self.compile_statements()
+    def peek_value(self, n=1):
+        """Returns the value n tokens past the current one, or None past the end."""
+        if self.token_pos + n < len(self.values):
+            return self.values[self.token_pos + n]
+        return None
 
-    def compile_do_statement(self):
-        print("do_statement")
+    def token_position(self):
+        """Returns the line and column of the current token, or None past the end."""
+        if self.token_pos < len(self.offsets):
+            return self.position(self.offsets[self.token_pos])
+        return None
 
-        self.tokenizer.advance()
+    def advance(self):
+        """Moves to the next token; returns False once the tokens are used up."""
+        if self.token_pos < len(self.values):
+            self.token_pos += 1
+        return self.token_pos < len(self.values)
 
-        print("procedure call", self.tokenizer.current_token())
 
-        self.tokenizer.advance()
+class LazyJackTokenizer(TokenCursor):
+    """Pulls tokens from iter_tokens on demand through a small lookahead buffer.
 
-        print(";")  # Print semicolon
+    Works on a string or a text stream, never holds the token list, and lets parsing start
+    before the source has been read to the end.
+    """
 
-        self.tokenizer.advance()
+    def __init__(self, source_code, chunk_size=CHUNK_SIZE):
+        self.stream = iter_tokens(source_code, chunk_size)
+        self.lookahead = deque()
+        self.fill(1)
 
-    def compile_return_statement(self):
-        print("returs_statement")
+    def fill(self, count):
+        while len(self.lookahead) < count:
+            token = next(self.stream, None)
+            if token is None:
+                return False
+            self.lookahead.append(token)
+        return True
 
-        self.tokenizer.advance()
+    def get_tokens(self):
+        # Drains the stream; only for debugging small inputs
+        tokens = [Token(*token[:3]) for token in self.lookahead]
+        self.lookahead.clear()
+        tokens.extend(Token(*token[:3]) for token in self.stream)
+        return tokens
+
+    def token_type(self):
+        if self.lookahead:
+            return self.lookahead[0][0]
+        return None
 
-        print("return value", self.tokenizer.current_token())
+    def token_value(self):
+        if self.lookahead:
+            return self.lookahead[0][1]
+        return None
 
-        self.tokenizer.advance()
+    def token_offset(self):
+        if self.lookahead:
+            return self.lookahead[0][2]
+        return None
 
-        print(";") 
-        
-        self.tokenizer.advance()
+    def peek_value(self, n=1):
+        if self.fill(n + 1):
+            return self.lookahead[n][1]
+        return None
 
+    def token_position(self):
+        if self.lookahead:
+            return self.lookahead[0][3:]
+        return None
 
-source_code = """
-class Main {
-    function void main() {
-        var int x;
-        let x = 5;
-        do Output.printString("Hello, world!");
-        return;
+    def advance(self):
+        if self.lookahead:
+            self.lookahead.popleft()
+        return self.fill(1)
+
+
+if __name__ == "__main__":
+    source_code = """
+    class Main {
+        function void main() {
+            var int x;
+            let x = 5;
+            do Output.printString("Hello, world!");
+            return;
+        }
     }
+    """
 
-"""
-
-# for token in tokenizer.get_tokens():
-    # print(token)
-
-tokenizer = JackTokenizer(source_code)
-tokens = tokenizer.get_tokens()
-
-print(tokens)
-# print(tokens[0])
-
-parser = JackParser(tokenizer)
+    tokenizer = JackTokenizer(source_code)
 
-# Access and print each token one by one
-while tokenizer.current_token():
-    print(tokenizer.current_token())
-    tokenizer.advance()
\ No newline at end of file
+    # Access and print each token one by one
+    while tokenizer.current_token():
+        print(tokenizer.current_token())
+        tokenizer.advance()